@@ -4,6 +4,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from scipy import stats
 from glob import glob
+import concurrent.futures
 import ee
 import geemap
 import os
@@ -18,10 +19,33 @@ import numpy as np
 from IPython.display import Image, display
 
 
+def time_chunks(start, end, years_per_chunk):
+    """
+    Split [start, end) ('YYYY-MM-DD' strings) into consecutive ranges of at most years_per_chunk
+    calendar years. Chunks after the first start on 1 January, so no year is split across chunks.
+    """
+    start, end = datetime.strptime(start, '%Y-%m-%d'), datetime.strptime(end, '%Y-%m-%d')
+    chunks = []
+    while start < end:
+        chunk_end = min(datetime(start.year + years_per_chunk, 1, 1), end)
+        chunks.append((start.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d')))
+        start = chunk_end
+    return chunks
+
+
 class NDVIPipeline:
-    def __init__(self, max_error=1):
+    """
+    water_mode='vector' cuts water polygons out of the donut geometry; water_mode='raster' keeps the
+    donut and masks water pixels of the NDVI images at analysis scale instead (no vectorization).
+    """
+
+    def __init__(self, max_error=1, water_mode='vector', scale=500):
+        if water_mode not in ('vector', 'raster'):
+            raise ValueError(f"water_mode must be 'vector' or 'raster', got {water_mode!r}")
         self.water_mask = ee.Image("JRC/GSW1_4/GlobalSurfaceWater").select('max_extent')
         self.max_error = max_error
+        self.water_mode = water_mode
+        self.scale = scale
 
     # --- Geometry processing ---
     def buffer_polygon(self, geom, buffer_distance=10000):
@@ -45,6 +69,20 @@ class NDVIPipeline:
         geom = feat.difference(water_vect.geometry(), maxError=self.max_error)
         return geom
 
+    def masked_geometry(self, geom):
+        """Water-masked geometry in vector mode, the geometry itself in raster mode"""
+        return self.mask_water(geom) if self.water_mode == 'vector' else geom
+
+    def mask_images(self, collection):
+        """In raster mode, mask pixels that are mostly (smoothed) water at analysis scale in every image"""
+        if self.water_mode != 'raster':
+            return collection
+        water = self.water_mask.focalMax(radius=30, units='meters', kernelType='square')\
+                               .focalMin(radius=30, units='meters', kernelType='square').unmask(0)
+        land = water.reduceResolution(reducer=ee.Reducer.mean(), maxPixels=1024)\
+                    .reproject(self.water_mask.projection().atScale(self.scale)).lte(0.5)
+        return collection.map(lambda img: img.updateMask(land))
+
     def get_biome(self, geom):
         """Get biome with largest overlap and return biome name string."""
         ecoregions = ee.FeatureCollection("RESOLVE/ECOREGIONS/2017")
@@ -72,70 +110,109 @@ class NDVIPipeline:
         ndvi = image.normalizedDifference(['sur_refl_b02', 'sur_refl_b01']).rename('NDVI')
         return image.addBands(ndvi).copyProperties(image, ['system:time_start'])
 
-    def prepare_modis_collection(self, aoi, start_date, end_date):
-        col = (ee.ImageCollection('MODIS/061/MOD09A1')
-               .filterDate(start_date, end_date).filterBounds(aoi))
-        print("MODIS images before cloud mask:", col.size().getInfo())
-        first_img = col.first()
-        print("First image bands:", first_img.bandNames().getInfo())
-        col = (col
+    def prepare_modis_collection(self, aoi, start_date, end_date, debug=False):
+        """MODIS images in [start_date, end_date) with clouds masked and NDVI added; aoi=None keeps every image"""
+        raw = ee.ImageCollection('MODIS/061/MOD09A1').filterDate(start_date, end_date)
+        if aoi is not None:
+            raw = raw.filterBounds(aoi)
+        if debug:
+            print("MODIS images before cloud mask:", raw.size().getInfo())
+            print("First image bands:", raw.first().bandNames().getInfo())
+        col = (raw
             .map(self.mask_modis_clouds)
             .map(self.add_ndvi)
             .filter(ee.Filter.listContains("bandNames", "NDVI"))
             .filter(ee.Filter.notNull(['NDVI'])))
-        print("MODIS images after cloud mask and NDVI:", col.size().getInfo())
+        if debug:
+            print("MODIS images after cloud mask and NDVI:", col.size().getInfo())
         return col
 
-    def monthly_median(self, collection):
-        def by_month(month):
-            start = ee.Date.fromYMD(2001, month, 1)
-            end = start.advance(1, 'month')
-            filtered = collection.filterDate(start, end)
-            median = filtered.median().set('month', month).set('system:time_start', start.millis())
-            return median.select('NDVI')
-        months = ee.List.sequence(1, 12)
-        monthly = ee.ImageCollection(months.map(by_month))
-        return monthly
-
-    def rolling_median(self, collection, window=3):
+    def monthly_median(self, collection, start_date='2001-01-01', end_date='2023-12-31'):
         """
-        Apply rolling median smoothing over monthly NDVI ImageCollection.
-        This function assumes that each image has a 'month' property from 1 to 12.
+        Year x month NDVI medians for every calendar month in [start_date, end_date), built in one
+        mapped pass over month offsets. Each image carries 'year', 'month', 'n_images' and
+        system:time_start; months without any valid image are dropped.
         """
-        def roll(month):
-                month = ee.Number(month)
-                half_window = ee.Number((window - 1) // 2)
-
-                window_start = month.subtract(half_window).max(1)
-                window_end = month.add(half_window).min(12)
-
-                valid_months = ee.List.sequence(window_start, window_end)
-
-                # Filter images by 'month' property
-                filtered = collection.filter(ee.Filter.inList('month', valid_months))
-                median = filtered.median().set('month', month).set('system:time_start', ee.Date.fromYMD(2001, month, 1).millis())
-
-                return median
-
-        months = ee.List.sequence(1, 12)
-        return ee.ImageCollection(months.map(roll))
+        first = ee.Date(start_date)
+        first = ee.Date.fromYMD(first.get('year'), first.get('month'), 1)
+        n_months = ee.Date(end_date).difference(first, 'month').ceil()
+
+        def by_month(offset):
+            start = first.advance(offset, 'month')
+            filtered = collection.filterDate(start, start.advance(1, 'month')).select('NDVI')
+            return (filtered.median()
+                    .set('year', start.get('year'))
+                    .set('month', start.get('month'))
+                    .set('n_images', filtered.size())
+                    .set('system:time_start', start.millis()))
+
+        monthly = ee.ImageCollection(ee.List.sequence(0, n_months.subtract(1)).map(by_month))
+        return monthly.filter(ee.Filter.gt('n_images', 0))
+
+    def rolling_median(self, monthly_collection, window=3):
+        """
+        Rolling median over a monthly collection from monthly_median: each month becomes the median of
+        the monthly composites within (window - 1) // 2 months on either side, across year boundaries.
+        Windows are matched with a single join on system:time_start, so the raw collection is not re-filtered.
+        """
+        half_window = (window - 1) // 2
+        # Months start on the 1st, so k months apart is at least 28 + 30 * (k - 1) days
+        max_gap = ee.Number(half_window * 31 * 24 * 60 * 60 * 1000)
+        join = ee.Join.saveAll(matchesKey='window')
+        time_filter = ee.Filter.maxDifference(
+            difference=max_gap, leftField='system:time_start', rightField='system:time_start')
+        joined = join.apply(monthly_collection, monthly_collection, time_filter)
+
+        def roll(img):
+            img = ee.Image(img)
+            neighbours = ee.ImageCollection.fromImages(img.get('window'))
+            return (neighbours.median().rename('NDVI')
+                    .copyProperties(img, ['year', 'month', 'n_images', 'system:time_start']))
+
+        return ee.ImageCollection(joined.map(roll))
 
     def annual_median(self, monthly_collection):
+        """Annual median of the monthly composites, one image per year present in the collection"""
         def by_year(year):
-            start = ee.Date.fromYMD(year, 1, 1)
-            end = start.advance(1, 'year')
-            filtered = monthly_collection.filterDate(start, end)
-            median = filtered.median().set('year', year).set('system:time_start', start.millis())
-            return median.select('NDVI')
-        years = ee.List.sequence(2001, 2023)
-        annual = ee.ImageCollection(years.map(by_year))
-        return annual
-
-    def extract_time_series(self, annual_collection, geom, reducer=ee.Reducer.median()):
+            year = ee.Number(year)
+            filtered = monthly_collection.filter(ee.Filter.eq('year', year))
+            return (filtered.median().rename('NDVI')
+                    .set('year', year)
+                    .set('system:time_start', ee.Date.fromYMD(year, 1, 1).millis()))
+        years = monthly_collection.aggregate_array('year').distinct().sort()
+        return ee.ImageCollection(years.map(by_year))
+
+    def annual_composites(self, aoi, start='2001-01-01', end='2023-12-31', apply_smoothing=True,
+                          window=3, chunk_years=None):
         """
-        Extract annual NDVI time series for a single polygon geometry.
-        Returns a pandas DataFrame with columns ['year', 'NDVI']
+        Annual NDVI collection for aoi (None for no spatial filter) over [start, end), from MODIS ->
+        year x month medians -> optional rolling median -> annual medians. With chunk_years, the range
+        is composited in chunks of that many years and merged; each chunk is padded by half the
+        smoothing window so results match an unchunked run.
         """
+        if not chunk_years:
+            modis_col = self.prepare_modis_collection(aoi, start, end)
+            monthly = self.monthly_median(modis_col, start, end)
+            if apply_smoothing:
+                monthly = self.rolling_median(monthly, window)
+            return self.mask_images(self.annual_median(monthly))
+
+        pad = (window - 1) // 2 if apply_smoothing else 0
+        annual = None
+        for chunk_start, chunk_end in time_chunks(start, end, chunk_years):
+            padded_start = ee.Date(chunk_start).advance(-pad, 'month')
+            padded_end = ee.Date(chunk_end).advance(pad, 'month')
+            modis_col = self.prepare_modis_collection(aoi, padded_start, padded_end)
+            monthly = self.monthly_median(modis_col, padded_start, padded_end)
+            if apply_smoothing:
+                monthly = self.rolling_median(monthly, window)
+            monthly = monthly.filterDate(chunk_start, chunk_end)
+            chunk = self.annual_median(monthly)
+            annual = chunk if annual is None else annual.merge(chunk)
+        return self.mask_images(annual)
+
+    def time_series_collection(self, annual_collection, geom, reducer=ee.Reducer.median()):
+        """Server-side annual NDVI time series for a polygon as an ee.FeatureCollection of (year, NDVI)"""
         def reduce_image(img):
             stat = img.reduceRegion(
                 reducer=reducer,
@@ -147,16 +224,87 @@ class NDVIPipeline:
             year = ee.Date(img.get('system:time_start')).get('year')
             return ee.Feature(None, {'year': year, 'NDVI': ndvi})
 
-        ts = annual_collection.map(reduce_image).filter(ee.Filter.notNull(['NDVI']))
-        ts_list = ts.getInfo()['features']
+        return annual_collection.map(reduce_image).filter(ee.Filter.notNull(['NDVI']))
 
+    def time_series_dataframe(self, features):
+        """Convert fetched time series features to a DataFrame with columns ['year', 'NDVI']"""
         data = []
-        for f in ts_list:
+        for f in features:
             props = f['properties']
-            if props['NDVI'] is not None:
+            if props.get('NDVI') is not None:
                 data.append({'year': int(props['year']), 'NDVI': float(props['NDVI'])})
-        df = pd.DataFrame(data).sort_values('year')
-        return df
+        return pd.DataFrame(data, columns=['year', 'NDVI']).sort_values('year')
+
+    def extract_time_series(self, annual_collection, geom, reducer=ee.Reducer.median()):
+        """
+        Extract annual NDVI time series for a single polygon geometry.
+        Returns a pandas DataFrame with columns ['year', 'NDVI']
+        """
+        ts = self.time_series_collection(annual_collection, geom, reducer)
+        return self.time_series_dataframe(ts.getInfo()['features'])
+
+    def masked_donuts(self, polygons, buffer_distance=10000):
+        """Replace each feature's geometry with its (in vector mode water-masked) donut, server-side"""
+        return polygons.map(lambda f: f.setGeometry(self.masked_geometry(self.buffer_polygon(f.geometry(), buffer_distance))))
+
+    def annual_stack(self, annual_collection):
+        """Annual NDVI collection as one image with a band per year, named NDVI_<year>"""
+        names = annual_collection.aggregate_array('year').map(
+            lambda y: ee.String('NDVI_').cat(ee.Number(y).format('%d')))
+        return annual_collection.select('NDVI').toBands().rename(names)
+
+    def extract_time_series_batch(self, annual_collection, polygons, id_property='WDPA_PID',
+                                  reducer=ee.Reducer.median(), chunk_size=100, max_workers=8, buffer_distance=10000):
+        """
+        Annual NDVI time series for many polygons at once.
+        polygons is a list of ee.Feature carrying id_property, split client-side into chunks of chunk_size,
+        or an ee.FeatureCollection, reduced as a single chunk. Each chunk is turned into masked donuts of
+        buffer_distance (None to reduce the geometries as given) and reduced with one reduceRegions call
+        over the annual stack; chunks are fetched concurrently from a thread pool.
+        Returns a long DataFrame with columns [id_property, 'year', 'NDVI'].
+        """
+        if isinstance(polygons, (list, tuple)):
+            chunks = [ee.FeatureCollection(list(polygons[i:i + chunk_size])) for i in range(0, len(polygons), chunk_size)]
+        else:
+            chunks = [polygons]
+        if buffer_distance is not None:
+            chunks = [self.masked_donuts(chunk, buffer_distance) for chunk in chunks]
+
+        stack = self.annual_stack(annual_collection)
+
+        def reduce_chunk(chunk):
+            # forEachBand names every output after its band, also when the stack has a single year
+            reduced = stack.reduceRegions(collection=chunk, reducer=reducer.forEachBand(stack), scale=500)
+            # Drop geometries so only the per-year values come back
+            reduced = reduced.map(lambda f: ee.Feature(None, f.toDictionary()))
+            return reduced.getInfo()['features']
+
+        rows = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for features in executor.map(reduce_chunk, chunks):
+                for f in features:
+                    props = f['properties']
+                    for key, value in props.items():
+                        if key.startswith('NDVI_') and value is not None:
+                            rows.append({id_property: props.get(id_property), 'year': int(key[5:]), 'NDVI': float(value)})
+        df = pd.DataFrame(rows, columns=[id_property, 'year', 'NDVI'])
+        return df.sort_values([id_property, 'year']).reset_index(drop=True)
+
+    def run_pipeline_batch(self, polygons, id_property='WDPA_PID', buffer_distance=10000,
+                           start='2001-01-01', end='2023-12-31', apply_smoothing=True,
+                           chunk_years=None, chunk_size=100, max_workers=8):
+        """
+        Batched run_pipeline for many polygons (list of ee.Feature carrying id_property, chunked client-side,
+        or an ee.FeatureCollection, reduced as one chunk).
+        Returns {polygon_id: DataFrame['year', 'NDVI']}, the layout export_results_to_csv,
+        plot_ndvi_timeseries and compute_trend expect.
+        """
+        # MOD09A1 images are global, so no spatial filter (a bounds() over all polygons would union them server-side)
+        annual = self.annual_composites(None, start, end, apply_smoothing, chunk_years=chunk_years)
+
+        df = self.extract_time_series_batch(annual, polygons, id_property, chunk_size=chunk_size,
+                                            max_workers=max_workers, buffer_distance=buffer_distance)
+        return {pid: group[['year', 'NDVI']].reset_index(drop=True) for pid, group in df.groupby(id_property)}
 
 # Optional: harmonic modeling (simplified)
    # 8. Optional: Harmonic modeling (simple example using GEE harmonic regression)
@@ -197,44 +345,60 @@ class NDVIPipeline:
 
     # === Full pipeline for single input polygon geometry ===
     def run_pipeline(self, input_geom, buffer_distance=10000, start='2001-01-01', end='2023-12-31',
-                     cloud_bits=[0,1], apply_smoothing=True, apply_harmonic=False):
+                     cloud_bits=[0,1], apply_smoothing=True, apply_harmonic=False, debug=False):
+        """
+        Biome, image count and NDVI time series are combined into one ee.Dictionary and fetched
+        with a single getInfo. debug=True adds the raw/masked image counts and first image bands
+        to that dictionary and prints them.
+        """
         # 1. Buffer polygon (donut shape)
         buffered_geom = self.buffer_polygon(input_geom, buffer_distance)
 
-        # 2. Mask water within buffered geometry
-        water_masked_geom = self.mask_water(buffered_geom)
+        # 2. Mask water within buffered geometry (vector mode; raster mode masks the images in step 6)
+        water_masked_geom = self.masked_geometry(buffered_geom)
 
-        # 3. Get biome name string
-        biome_name = self.get_biome(water_masked_geom).getInfo()
-        print(biome_name)
-        # 4. Prepare MODIS collection and NDVI calculation
+        # 3. Prepare MODIS collection and NDVI calculation
         modis_col = self.prepare_modis_collection(water_masked_geom, start, end)
-        size = modis_col.size().getInfo()
-        if size == 0:
-            raise ValueError("MODIS collection is empty after filtering — check dates, cloud mask, or geometry.")
 
-        # 5. Monthly median aggregation
-        monthly = self.monthly_median(modis_col)
+        # 4. Year x month median aggregation
+        monthly = self.monthly_median(modis_col, start, end)
 
-        # 6. Optional rolling median smoothing
+        # 5. Optional rolling median smoothing
         if apply_smoothing:
             monthly = self.rolling_median(monthly, window=3)
 
-        # 7. Annual median aggregation
-        annual = self.annual_median(monthly)
+        # 6. Annual median aggregation
+        annual = self.mask_images(self.annual_median(monthly))
 
-        # 8. Optional harmonic modeling
+        # 7. Optional harmonic modeling
         harmonic_results = None
         if apply_harmonic:
             harmonic_results = self.harmonic_modeling(monthly)
 
-        # 9. Extract NDVI time series for water-masked buffered polygon
-        ndvi_ts = self.extract_time_series(annual, water_masked_geom)
+        # 8. Biome, emptiness check and NDVI time series in one server evaluation
+        outputs = {
+            'biome': self.get_biome(water_masked_geom),
+            'n_images': modis_col.size(),
+            'timeseries': self.time_series_collection(annual, water_masked_geom),
+        }
+        if debug:
+            raw = ee.ImageCollection('MODIS/061/MOD09A1').filterDate(start, end).filterBounds(water_masked_geom)
+            outputs['n_raw_images'] = raw.size()
+            outputs['first_bands'] = raw.first().bandNames()
+        info = ee.Dictionary(outputs).getInfo()
+
+        if debug:
+            print("MODIS images before cloud mask:", info['n_raw_images'])
+            print("First image bands:", info['first_bands'])
+            print("MODIS images after cloud mask and NDVI:", info['n_images'])
+            print(info['biome'])
+        if info['n_images'] == 0:
+            raise ValueError("MODIS collection is empty after filtering — check dates, cloud mask, or geometry.")
 
         # Return biome and NDVI DataFrame and optionally harmonic coefficients
         return {
-            'biome': biome_name,
-            'ndvi_timeseries': ndvi_ts,
+            'biome': info['biome'],
+            'ndvi_timeseries': self.time_series_dataframe(info['timeseries']['features']),
             'harmonic': harmonic_results
         }
 
@@ -290,7 +454,7 @@ def compute_trend(results_dict):
     return trends
 
 # === Example usage snippet ===
-# results, _ = run_ndvi_pipeline(polygons, buffer_m=1000, apply_smoothing=True)
+# results = NDVIPipeline().run_pipeline_batch(polygons, id_property='WDPA_PID', buffer_distance=1000)
 # export_results_to_csv(results, folder_path='./ndvi_output')
 # plot_ndvi_timeseries(results)
 # trends = compute_trend(results)
@@ -1,112 +1,374 @@
-from utils import *
+from core import GeometryOperations, ImageOperations, StatsOperations, FeatureProcessor, WATER_MODES, REDUCTION_LEVELS
+from export import ExportResults, ExportConfig
 from config import *
-import pandas as pd
-import concurrent.futures
+from scheduler import ExportScheduler, EETaskBackend, ACTIVE_STATES, is_memory_error
+from manifest import RunManifest, list_exported_tables
+from geometry_cache import AOICache
+from biomes import load_biome_lookup
+from pa_attributes import PAAttributeCache
+from donuts import DonutStore
+from composite_cache import tile_label
+from instrument import trace
 import ee
 import time
 
 
-def run_analysis(wdpaid, year):
-    """Function to analyze habitat edge at protected area boundary"""
+EXPORT_CONFIG = ExportConfig()
+AOI_CACHE_DIR = 'aoi_cache'
+PA_ATTRIBUTES = 'pa_attributes.json'
+
+
+def table_prefix(wdpaid, year, export_config=None):
+    """GCS file name prefix of the stats table for one protected area and year"""
+    return f'{(export_config or EXPORT_CONFIG).table_prefix}/{wdpaid}_{year}'
+
+
+def make_feature_processor(pa_attributes=None, water_mode='vector', use_aoi_cache=True, reduction=None,
+                           donut_store=None, composite_cache=None):
+    """
+    FeatureProcessor with the local AOI cache, biome lookup and optional PAAttributeCache; safe to share across threads.
+    water_mode is 'vector' (water polygons cut out of the AOI) or 'raster' (water pixels masked in the images).
+    reduction holds StatsOperations settings (tile_size, tile_scale), e.g. one of core.REDUCTION_LEVELS.
+    donut_store (a donuts.DonutStore) supplies precomputed local donuts, composite_cache
+    (a composite_cache.CompositeCache) precomputed annual composites.
+    """
+    aoi_cache = AOICache(AOI_CACHE_DIR) if use_aoi_cache else None
+    geo_ops = GeometryOperations(aoi_cache=aoi_cache, water_mode=water_mode, donut_store=donut_store)
+    stats_ops = StatsOperations(**(reduction or {}))
+    return FeatureProcessor(geo_ops, ImageOperations(composite_cache), stats_ops, load_biome_lookup(), pa_attributes)
+
+
+def analysis_features(wdpaid, year, prefiltered=False, feature_processor=None):
+    """ee.FeatureCollection of boundary/buffer statistics (one feature per band) for one protected area and year"""
     # Initialize classes
-    geo_ops = GeometryOperations()
-    img_ops = ImageOperations()
-    stats_ops = StatsOperations()
-    viz = Visualization()
-    feature_processor = FeatureProcessor(geo_ops, img_ops, stats_ops)
-    exporter = ExportResults()
+    feature_processor = feature_processor or make_feature_processor()
+    geo_ops = feature_processor.geo_ops
+    img_ops = feature_processor.img_ops
 
     # Load and process protected area geometry
-    pa = load_protected_area(wdpaid)
+    pa = load_protected_area(wdpaid, prefiltered)
     pa_geometry = pa.geometry()
-    aoi = geo_ops.buffer_polygon(pa_geometry)
-    aoi = geo_ops.mask_water(aoi)
+    aoi = geo_ops.masked_aoi(wdpaid, pa_geometry)
 
     # Process imagery and add indices
-    modis_ic = img_ops.modis.filter(img_ops.filter_for_year(aoi, year))
-    band_names = modis_ic.first().bandNames()
-    composite = modis_ic.reduce(ee.Reducer.median()).rename(band_names).clip(aoi)
-    image = img_ops.add_indices_to_image(composite)
+    image = geo_ops.mask_image(img_ops.indexed_composite(aoi, year, wdpaid))
 
     # Process features and collect statistics
-    feature_info = feature_processor.collect_feature_info(pa, aoi)
-    features = feature_processor.process_all_bands_ee(image, pa_geometry, aoi, feature_info, year)
-    stats_fc = ee.FeatureCollection(features)
+    feature_info = feature_processor.collect_feature_info(pa, aoi, wdpaid)
+    features = feature_processor.process_all_bands_ee(image, pa_geometry, aoi, feature_info, year, wdpaid)
+    return ee.FeatureCollection(features)
+
+
+def build_analysis_task(wdpaid, year, prefiltered=False, export_config=None, feature_processor=None):
+    """Build the (unstarted) export task analyzing habitat edge at protected area boundary"""
+    stats_fc = analysis_features(wdpaid, year, prefiltered, feature_processor)
 
     # Save results
-    #exporter.export_table_to_cloud(wdpaid, year, stats_fc)
-    task = ee.batch.Export.table.toCloudStorage(
-        collection=stats_fc,
-        description=f'{wdpaid}_{year}',
-        bucket='dse-staff',
-        fileNamePrefix=f'protected_areas/tables/{wdpaid}_{year}',
-        fileFormat='CSV'
-    )
+    task = ExportResults(export_config or EXPORT_CONFIG).table_task(stats_fc, wdpaid, year)
+    return task
+
+
+def multi_year_name(pairs):
+    """File name (below the table prefix) of a multi-year stats table covering a chunk of (wdpaid, year) pairs"""
+    wdpaids = list(dict.fromkeys(w for w, _ in pairs))
+    years = [y for _, y in pairs]
+    name = wdpaids[0] if len(wdpaids) == 1 else f'{wdpaids[0]}_{len(wdpaids)}pa'
+    return f'multi/{name}_{min(years)}_{max(years)}'
+
+
+def multi_year_prefix(pairs, export_config=None):
+    """GCS file name prefix of a multi-year stats table covering a chunk of (wdpaid, year) pairs"""
+    return f'{(export_config or EXPORT_CONFIG).table_prefix}/{multi_year_name(pairs)}'
+
+
+def build_multi_year_task(pairs, prefiltered=False, export_config=None, columns=None, feature_processor=None):
+    """
+    Build one (unstarted) export task covering many (wdpaid, year) pairs.
+    Geometry, water mask, gHM and biome are computed once per protected area and
+    the per-year composite and statistics are mapped over an ee.List of its years.
+    columns (e.g. export.ANALYSIS_COLUMNS) limits the exported table to those columns.
+    """
+    feature_processor = feature_processor or make_feature_processor()
+    geo_ops = feature_processor.geo_ops
+
+    years_by_pa = {}
+    for wdpaid, year in pairs:
+        years_by_pa.setdefault(wdpaid, []).append(year)
+
+    collections = []
+    for wdpaid, years in years_by_pa.items():
+        pa = load_protected_area(wdpaid, prefiltered)
+        pa_geometry = pa.geometry()
+        aoi = geo_ops.masked_aoi(wdpaid, pa_geometry)
+        feature_info = feature_processor.collect_feature_info(pa, aoi, wdpaid)
+        collections.append(feature_processor.process_years_ee(pa_geometry, aoi, feature_info, years, wdpaid))
+
+    exporter = ExportResults(export_config or EXPORT_CONFIG)
+    task = exporter.consolidated_task(collections, multi_year_name(pairs), columns)
+    return task
+
+
+def chunk_by_pa(pairs, pas_per_task=1):
+    """Group (wdpaid, year) pairs into chunks holding all years of pas_per_task protected areas"""
+    years_by_pa = {}
+    for wdpaid, year in pairs:
+        years_by_pa.setdefault(wdpaid, []).append((wdpaid, year))
+    groups = list(years_by_pa.values())
+    return [tuple(p for group in groups[i:i + pas_per_task] for p in group)
+            for i in range(0, len(groups), pas_per_task)]
+
+
+def run_analysis(wdpaid, year):
+    """Function to analyze habitat edge at protected area boundary"""
+    task = build_analysis_task(wdpaid, year)
     task.start()
     print("Analysis complete for WDPA ID:", wdpaid, "for the year:", year)
     return task
 
 
-def run_all(wdpaids, start_year, n_years, max_concurrent=12, poll_interval=30):
+def prepare_composite_cache(composite_cache, tasks, backend=None, max_concurrent=12, poll_interval=5, max_workers=8,
+                            sleep=time.sleep):
     """
-    Submits up to max_concurrent GEE export tasks at a time, waits for completion before submitting more.
+    Assign grid tiles to the protected areas of tasks ((wdpaid, year) pairs), export the (tile, year)
+    composites the cache does not hold yet and wait for them, recording each completed one in the index.
+    Returns tasks ordered by tile, so protected areas sharing composites run together.
     """
+    composite_cache.assign_tiles({w for w, _ in tasks})
+    missing = composite_cache.missing(tasks)
+    if missing:
+        print(f"Composite cache: exporting {len(missing)} tile composites")
+        img_ops = ImageOperations()
+
+        def build(key):
+            tile, year = key
+            with trace(tile=tile_label(tile, composite_cache.tile_degrees), year=year, stage='composite'):
+                return composite_cache.export_task(tile, year, img_ops)
+
+        def on_finish(key, task_id, state):
+            if state == 'COMPLETED':
+                composite_cache.record(*key)
+
+        scheduler = ExportScheduler(backend or EETaskBackend(), max_concurrent=max_concurrent, tick=poll_interval,
+                                    max_workers=max_workers, sleep=sleep)
+        results = scheduler.run(missing, build, on_finish=on_finish)
+        failed = sum(1 for state in results.values() if state != 'COMPLETED')
+        if failed:
+            print(f"Composite cache: {failed} tile composites failed, those PAs compute their own composite")
+    return composite_cache.order_by_tile(tasks)
+
+
+class RunOptions:
+    """
+    What run_all exports and which local caches it uses.
+    multi_year=True puts all years of pas_per_task protected areas into one export; set
+    export_config.selectors (e.g. export.ANALYSIS_COLUMNS) to keep those tables narrow.
+    pa_attributes (a PAAttributeCache file, e.g. PA_ATTRIBUTES), donut_store (a file built by
+    donuts.build_donut_store) and composite_cache (a composite_cache.CompositeCache) are optional.
+    water_mode is as in make_feature_processor; exports failing on memory, pixel or time limits are
+    retried with the next of reduction_levels. prefiltered=True when wdpaids went through config.filter_eligible.
+    """
+
+    def __init__(self, export_config=None, multi_year=False, pas_per_task=1, prefiltered=False, water_mode='vector',
+                 reduction_levels=REDUCTION_LEVELS, pa_attributes=None, donut_store=None, composite_cache=None):
+        if water_mode not in WATER_MODES:
+            raise ValueError(f"water_mode must be one of {WATER_MODES}, got {water_mode!r}")
+        self.export_config = export_config or EXPORT_CONFIG
+        self.multi_year = multi_year
+        self.pas_per_task = pas_per_task
+        self.prefiltered = prefiltered
+        self.water_mode = water_mode
+        self.reduction_levels = reduction_levels
+        self.pa_attributes = pa_attributes
+        self.donut_store = donut_store
+        self.composite_cache = composite_cache
+
+
+def run_all(wdpaids, start_year, n_years, options=None, max_concurrent=12, poll_interval=5, max_workers=8,
+            backend=None, manifest_path='run_manifest.sqlite', check_outputs=True, sleep=time.sleep):
+    """Export the stats of every (wdpaid, year) per options, resuming from the manifest; returns (states, records)"""
     years = [start_year + i for i in range(n_years)]
     tasks = [(wdpaid, year) for wdpaid in wdpaids for year in years]
-    task_queue = []
+    backend = backend or EETaskBackend()
+    options = options or RunOptions()
+    export_config = options.export_config
+    prefiltered, water_mode, composite_cache = options.prefiltered, options.water_mode, options.composite_cache
 
-    for wdpaid, year in tasks:
-        # Start a new export task
-        task = run_analysis(wdpaid, year) 
-        task_queue.append((task, wdpaid, year))
+    running = {}
+    on_submit = on_finish = None
+    if manifest_path:
+        manifest = RunManifest(manifest_path)
+        done = manifest.with_state('COMPLETED')
+        if check_outputs and export_config.destination == 'cloud':
+            done |= list_exported_tables(export_config.bucket, export_config.table_prefix + '/',
+                                         export_config.extension)
 
-        # If we've reached the max_concurrent limit, wait for at least one to finish
-        while len([t for t,_,_ in task_queue if t.active()]) >= max_concurrent:
-            print(f"Waiting for tasks to finish... ({len(task_queue)} submitted)")
-            time.sleep(poll_interval)
-            # Remove finished tasks from the queue
-            task_queue = [(t, w, y) for t, w, y in task_queue if t.active()]
+        # Re-attach to tasks a previous run left in flight
+        entries = manifest.entries()
+        states = backend.list_states()
+        for key, entry in entries.items():
+            state = states.get(entry['task_id'])
+            if state in ACTIVE_STATES:
+                running.setdefault(entry['task_id'], []).append(key)
+            elif state is not None and state != entry['state']:
+                manifest.update_state(*key, state)
+                if state == 'COMPLETED':
+                    done.add(key)
+        running = {task_id: tuple(pairs) for task_id, pairs in running.items()}
 
-    # Wait for all remaining tasks to finish
-    while any(t.active() for t,_,_ in task_queue):
-        print(f"Waiting for final tasks to finish... ({len(task_queue)} total)")
-        time.sleep(poll_interval)
-        task_queue = [(t, w, y) for t, w, y in task_queue if t.active()]
+        skip = done | {pair for pairs in running.values() for pair in pairs}
+        tasks = [(w, y) for w, y in tasks if (str(w), int(y)) not in skip]
+        print(f"Manifest: {len(done)} done, {len(skip) - len(done)} still running, {len(tasks)} to submit")
 
-    print("All exports complete.")
+        def on_submit(chunk, task_id):
+            for pair in chunk:
+                manifest.record_submit(*pair, task_id, chunk_prefix(chunk))
 
+        def on_finish(chunk, task_id, state):
+            for pair in chunk:
+                manifest.update_state(*pair, state)
 
+    donuts = DonutStore(options.donut_store, {w for w, _ in tasks}) if options.donut_store else None
+    if composite_cache is not None:
+        tasks = prepare_composite_cache(composite_cache, tasks, backend, max_concurrent, poll_interval, max_workers,
+                                        sleep)
 
-def image_analysis(wdpaid, year, band_name):
-    print(f"Processing WDPA ID {wdpaid} for year {year}")
+    # Time-invariant attributes once per protected area instead of in every task graph
+    attributes = None
+    if options.pa_attributes:
+        processor = make_feature_processor(water_mode=water_mode, donut_store=donuts)
+        attributes = PAAttributeCache(options.pa_attributes, processor.geo_ops)
+        with trace(stage='attributes'):
+            added = attributes.fill([w for w, _ in tasks], processor.stats_ops, processor.biome_lookup, prefiltered)
+        print(f"PA attributes: {added} fetched, {len(attributes.attributes)} cached")
 
-    pa_geometry = load_protected_area(wdpaid).geometry()
+    # Each scheduler key is a chunk of (wdpaid, year) pairs exported together
+    if options.multi_year:
+        chunks = chunk_by_pa(tasks, options.pas_per_task)
+        chunk_prefix = lambda chunk: multi_year_prefix(chunk, export_config)
+        build = lambda chunk, processor: build_multi_year_task(chunk, prefiltered, export_config, None, processor)
+    else:
+        chunks = [(pair,) for pair in tasks]
+        chunk_prefix = lambda chunk: table_prefix(*chunk[0], export_config)
+        build = lambda chunk, processor: build_analysis_task(*chunk[0], prefiltered, export_config, processor)
+
+    chunk_results, records = {}, []
+    for level, reduction in enumerate(options.reduction_levels):
+        feature_processor = make_feature_processor(attributes, water_mode, reduction=reduction, donut_store=donuts,
+                                                   composite_cache=composite_cache)
+
+        def traced_build(chunk):
+            wdpaid, year = chunk[0] if len(chunk) == 1 else (chunk[0][0], 'multi')
+            with trace(wdpaid=wdpaid, year=year, stage='build', reduction_level=level):
+                return build(chunk, feature_processor)
+
+        scheduler = ExportScheduler(backend, max_concurrent=max_concurrent, tick=poll_interval, max_workers=max_workers,
+                                    sleep=sleep)
+        chunk_results.update(scheduler.run(chunks, traced_build, on_submit=on_submit, on_finish=on_finish,
+                                           running=running))
+        records += [dict(record, reduction_level=level) for record in scheduler.results]
+        running = None
+
+        # Too big for this level: retry with the next one
+        chunks = [r['key'] for r in scheduler.results if r['state'] == 'FAILED' and is_memory_error(r['error'])]
+        if not chunks or level + 1 == len(options.reduction_levels):
+            break
+        print(f"{len(chunks)} exports ran out of memory or time, retrying with {options.reduction_levels[level + 1]}")
+    results = {pair: state for chunk, state in chunk_results.items() for pair in chunk}
+
+    failed = [key for key, state in results.items() if state != 'COMPLETED']
+    print(f"All exports complete. {len(results) - len(failed)} succeeded, {len(failed)} failed.")
+    return results, records
+
+
+def compare_water_modes(wdpaids, year, prefiltered=False):
+    """
+    Evaluate the boundary/buffer statistics of each protected area with vector and with raster water
+    masking (without the AOI cache, so vector mode pays for its vectorization) and time each getInfo.
+    Returns a DataFrame with one row per (WDPA_PID, band_name, stat): the value in each mode, their
+    relative difference, the seconds each mode's evaluation took, and any error (e.g. a timeout).
+    """
+    import pandas as pd
+    rows = []
+    for wdpaid in wdpaids:
+        values, seconds, errors = {}, {}, {}
+        for mode in WATER_MODES:
+            processor = make_feature_processor(water_mode=mode, use_aoi_cache=False)
+            start = time.perf_counter()
+            try:
+                with trace(wdpaid=wdpaid, year=year, stage=f'water_{mode}'):
+                    features = analysis_features(wdpaid, year, prefiltered, processor).getInfo()['features']
+                errors[mode] = None
+            except ee.EEException as e:
+                features, errors[mode] = [], str(e)
+            seconds[mode] = time.perf_counter() - start
+            values[mode] = {(f['properties']['band_name'], key): value
+                            for f in features for key, value in f['properties'].items()
+                            if key.startswith(('boundary_x_', 'buffer_x_'))}
+        for band_name, stat in sorted(set(values['vector']) | set(values['raster'])):
+            vector = values['vector'].get((band_name, stat))
+            raster = values['raster'].get((band_name, stat))
+            rel = abs(raster - vector) / max(abs(vector), 1e-12) if None not in (vector, raster) else None
+            rows.append({'WDPA_PID': wdpaid, 'band_name': band_name, 'stat': stat, 'vector': vector,
+                         'raster': raster, 'rel_diff': rel, 'vector_s': seconds['vector'],
+                         'raster_s': seconds['raster'], 'vector_error': errors['vector'],
+                         'raster_error': errors['raster']})
+        if not values['vector'] and not values['raster']:
+            rows.append({'WDPA_PID': wdpaid, 'vector_s': seconds['vector'], 'raster_s': seconds['raster'],
+                         'vector_error': errors['vector'], 'raster_error': errors['raster']})
+    return pd.DataFrame(rows)
+
+
+def build_image_task(wdpaid, year, band_name, prefiltered=False, water_mode='vector', composite_cache=None):
+    """Build the (unstarted) export of the gradient magnitude of one band within 1km of the PA boundary"""
+    geo_ops = GeometryOperations(water_mode=water_mode)
+    img_ops = ImageOperations(composite_cache)
+
+    pa_geometry = load_protected_area(wdpaid, prefiltered).geometry()
     aoi = geo_ops.buffer_polygon(pa_geometry, 10000) 
 
-    modis_ic = img_ops.modis.filter(img_ops.filter_for_year(aoi, year))
-    band_names = modis_ic.first().bandNames()
-    composite = modis_ic.reduce(ee.Reducer.median()).rename(band_names).clip(aoi)
-    image = img_ops.add_indices_to_image(composite)
+    image = geo_ops.mask_image(img_ops.indexed_composite(aoi, year, wdpaid))
     single_band = image.select(band_name)
 
-    buffer_img = img_ops.get_gradient_magnitude(single_band).clip(aoi)
+    buffer_img = geo_ops.mask_image(img_ops.get_gradient_magnitude(single_band)).clip(aoi)
     boundary_buffer_1km = geo_ops.buffer_polygon(pa_geometry, 1000)
     boundary_img = buffer_img.clip(boundary_buffer_1km)
 
-    exporter.export_image_to_cloud(boundary_img, band_name, wdpaid, year)
+    return ExportResults().image_task(boundary_img, band_name, wdpaid, year)
+
+
+def image_analysis(wdpaid, year, band_name):
+    print(f"Processing WDPA ID {wdpaid} for year {year}")
+    task = build_image_task(wdpaid, year, band_name)
+    task.start()
+    return task
 
 
-def analysis_to_image(wdpaids, start_year, n_years, band_name, max_workers=4):
+def analysis_to_image(wdpaids, start_year, n_years, band_name, max_workers=4, max_concurrent=12,
+                      poll_interval=5, backend=None, prefiltered=False, water_mode='vector', composite_cache=None,
+                      sleep=time.sleep):
+    """
+    Export boundary gradient images for every (wdpaid, year) through the same scheduler as run_all:
+    max_workers threads build and start exports, at most max_concurrent run at once.
+    With a composite_cache, missing tile composites are exported first and work is ordered by tile.
+    sleep is used for every wait between status checks, as in run_all.
+    Returns ({(wdpaid, year): final_state}, records) with the scheduler's per-task records, as run_all.
+    """
     years = [start_year + i for i in range(n_years)]
     tasks = [(wdpaid, year) for wdpaid in wdpaids for year in years]
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_task = {
-            executor.submit(image_analysis, wdpaid, year, band_name): (wdpaid, year)
-            for wdpaid, year in tasks
-        }
-        for future in concurrent.futures.as_completed(future_to_task):
-            wdpaid, year = future_to_task[future]
-            try:
-                future.result()
-            except Exception as exc:
-                print(f"WDPA ID {wdpaid}, Year {year} generated an exception: {exc}")
\ No newline at end of file
+    backend = backend or EETaskBackend()
+    if composite_cache is not None:
+        tasks = prepare_composite_cache(composite_cache, tasks, backend, max_concurrent, poll_interval, max_workers,
+                                        sleep)
+
+    def build(key):
+        wdpaid, year = key
+        with trace(wdpaid=wdpaid, year=year, stage='build'):
+            return build_image_task(wdpaid, year, band_name, prefiltered, water_mode, composite_cache)
+
+    scheduler = ExportScheduler(backend, max_concurrent=max_concurrent, tick=poll_interval,
+                                max_workers=max_workers, sleep=sleep)
+    results = scheduler.run(tasks, build)
+    failed = [record for record in scheduler.results if record['state'] != 'COMPLETED']
+    for record in failed:
+        print(f"WDPA ID {record['key'][0]}, Year {record['key'][1]} ended with {record['state']}: {record['error']}")
+    return results, scheduler.results
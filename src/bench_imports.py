@@ -0,0 +1,51 @@
+"""
+Import-time benchmark for worker start-up.
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and reports the median
+wall time per module plus the slowest packages it pulls in.
+
+    python bench_imports.py analysis core utils
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+
+def time_import(module, repeat=5):
+    """Median wall-clock seconds to start a fresh interpreter and import module"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f'import {module}'], cwd=here, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def slowest_imports(module, top=10):
+    """Top-level packages with the largest cumulative import time (seconds) for module"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=here, check=True, capture_output=True, text=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        if cumulative.isdigit() and not name.startswith(' '):
+            top_level = name.strip().split('.')[0]
+            packages[top_level] = max(packages.get(top_level, 0), int(cumulative) / 1e6)
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+if __name__ == '__main__':
+    modules = sys.argv[1:] or ['core', 'analysis', 'utils']
+    baseline = time_import('sys')
+    print(f"{'module':<15}{'seconds':>10}")
+    print(f"{'(interpreter)':<15}{baseline:>10.2f}")
+    for module in modules:
+        print(f"{module:<15}{time_import(module):>10.2f}")
+    for module in modules:
+        heavy = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in slowest_imports(module, top=5))
+        print(f"{module}: {heavy}")
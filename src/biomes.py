@@ -0,0 +1,114 @@
+import os
+import csv
+import functools
+import concurrent.futures
+
+
+ECOREGIONS_SHP = '../data/Ecoregions2017/Ecoregions2017.shp'
+BIOME_LOOKUP = '../data/biome_lookup.csv'
+EQUAL_AREA_CRS = 'EPSG:6933'
+
+
+def local_projection(lon, lat):
+    """Azimuthal equidistant CRS centred on (lon, lat), in meters: distances from the centre are true"""
+    return f'+proj=aeqd +lat_0={lat} +lon_0={lon} +x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs'
+
+
+def local_donuts(geometries, distances, tolerance=0):
+    """
+    +/- distance donuts of EPSG:4326 shapely geometries, distances in meters.
+    Each geometry is buffered in a local_projection centred on its own centroid, so the rings are
+    true distances at any latitude, as with the geodesic ee.Geometry.buffer; a planar buffer in
+    EQUAL_AREA_CRS is off by up to a factor of 1.7 away from the equator.
+    With tolerance > 0 the outline is simplified by tolerance / 2 before buffering and the donut
+    by tolerance / 2 after, so the donut stays within tolerance meters of the exact one.
+    Returns {distance: [EPSG:4326 geometries]} in the order of geometries.
+    """
+    import numpy as np
+    import shapely
+    from pyproj import Transformer
+
+    def reproject(geom, transformer):
+        return shapely.transform(geom, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+    donuts = {distance: [] for distance in distances}
+    for geom in geometries:
+        # Densify long edges (0.01 degrees, about 1 km) so they keep their shape when projected
+        geom = shapely.segmentize(shapely.make_valid(geom), 0.01)
+        center = geom.centroid
+        crs = local_projection(center.x, center.y)
+        local = reproject(geom, Transformer.from_crs('EPSG:4326', crs, always_xy=True))
+        if tolerance:
+            local = local.simplify(tolerance / 2, preserve_topology=True)
+        back = Transformer.from_crs(crs, 'EPSG:4326', always_xy=True)
+        for distance in distances:
+            donut = local.buffer(distance).difference(local.buffer(-distance))
+            if tolerance:
+                donut = donut.simplify(tolerance / 2, preserve_topology=True)
+            donuts[distance].append(reproject(donut, back))
+    return donuts
+
+
+def _dominant_biomes(pas, ecoregions):
+    """
+    Biome of the ecoregion with the largest intersection area for each PA in a chunk,
+    mirroring GeometryOperations.get_biome. Both frames must be in an equal-area CRS.
+    """
+    import pandas as pd
+    import geopandas as gpd
+    pieces = gpd.overlay(pas[['WDPA_PID', 'geometry']], ecoregions[['BIOME_NAME', 'geometry']],
+                         how='intersection', keep_geom_type=True)
+    if pieces.empty:
+        return pd.DataFrame(columns=['WDPA_PID', 'BIOME_NAME'])
+    pieces['intersection_area'] = pieces.area
+    largest = pieces.loc[pieces.groupby('WDPA_PID')['intersection_area'].idxmax()]
+    return largest[['WDPA_PID', 'BIOME_NAME']]
+
+
+def build_biome_lookup(pa_gdf, ecoregions_path=ECOREGIONS_SHP, out_path=BIOME_LOOKUP,
+                       buffer_distance=10000, chunk_size=500, max_workers=None):
+    """
+    Offline biome assignment for every PA in pa_gdf (needs WDPA_PID and geometry), done once.
+    Dominant biome is taken over the same +/- buffer_distance donut the EE analysis uses
+    (without the water mask), buffered with local_donuts and overlaid in an equal-area
+    projection. Chunks of PAs are
+    overlaid against the ecoregions they touch across a process pool.
+    Writes a WDPA_PID,BIOME_NAME csv and returns it as a DataFrame.
+    """
+    import numpy as np
+    import pandas as pd
+    import geopandas as gpd
+    ecoregions = gpd.read_file(ecoregions_path, columns=['BIOME_NAME']).to_crs(EQUAL_AREA_CRS)
+    ecoregions['geometry'] = ecoregions.geometry.make_valid()
+
+    pas = pa_gdf[['WDPA_PID', 'geometry']].to_crs('EPSG:4326')
+    pas['WDPA_PID'] = pas['WDPA_PID'].astype(str)
+    donuts = local_donuts(pas.geometry.values, [buffer_distance])[buffer_distance]
+    pas = gpd.GeoDataFrame({'WDPA_PID': pas['WDPA_PID'].values}, geometry=donuts, crs='EPSG:4326')
+    pas = pas.to_crs(EQUAL_AREA_CRS)
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for start in range(0, len(pas), chunk_size):
+            chunk = pas.iloc[start:start + chunk_size]
+            # Ship only the ecoregions that can intersect this chunk
+            nearby = np.unique(ecoregions.sindex.query(chunk.geometry, predicate='intersects')[1])
+            futures.append(executor.submit(_dominant_biomes, chunk, ecoregions.iloc[nearby]))
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+
+    lookup = pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=['WDPA_PID', 'BIOME_NAME'])
+    lookup = pas[['WDPA_PID']].merge(lookup, on='WDPA_PID', how='left').fillna({'BIOME_NAME': 'Unknown'})
+    lookup.to_csv(out_path, index=False)
+    load_biome_lookup.cache_clear()
+    return lookup
+
+
+@functools.lru_cache(maxsize=None)
+def load_biome_lookup(path=BIOME_LOOKUP):
+    """Return {WDPA_PID: BIOME_NAME} from the precomputed table, or {} if it has not been built"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='') as f:
+        return {row['WDPA_PID']: row['BIOME_NAME'] for row in csv.DictReader(f)}
@@ -0,0 +1,140 @@
+import io
+import os
+import re
+import json
+import glob
+import concurrent.futures
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class LocalBlob:
+    """Local file with the parts of the google.cloud.storage.Blob interface the combiner uses"""
+
+    def __init__(self, root, name):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self.generation = os.stat(self.path).st_mtime_ns
+
+    def download_as_bytes(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class LocalBucket:
+    """Directory that stands in for a GCS bucket, e.g. for testing or for gsutil-synced exports"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_blobs(self, prefix=''):
+        for path in sorted(glob.glob(os.path.join(self.root, '**', '*'), recursive=True)):
+            name = os.path.relpath(path, self.root).replace(os.sep, '/')
+            if os.path.isfile(path) and name.startswith(prefix):
+                yield LocalBlob(self.root, name)
+
+
+def gcs_bucket(bucket_name, pool_size=32):
+    """GCS bucket whose client keeps pool_size HTTP connections, so concurrent downloads reuse them"""
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+    client = storage.Client()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    client._http.mount('https://', adapter)
+    return client.bucket(bucket_name)
+
+
+class CsvCombiner:
+    """
+    Streams CSV exports from a bucket into a Parquet dataset partitioned by band_name/year.
+    Blobs are downloaded concurrently and written as they arrive, so memory holds at most
+    a window of frames, and each blob's generation is recorded so repeat runs only fetch
+    new or changed files.
+    """
+
+    STATE_FILE = '_ingested.json'
+    # Fixed column types, so IDs like '555_A' in one CSV and 916 in another land in one schema.
+    # Columns outside this list are kept as strings.
+    SCHEMA = pa.schema([
+        ('WDPA_PID', pa.string()), ('ORIG_NAME', pa.string()), ('year', pa.int64()), ('band_name', pa.string()),
+        ('BIOME_NAME', pa.string()), ('IUCN_CAT', pa.string()), ('GOV_TYPE', pa.string()),
+        ('OWN_TYPE', pa.string()), ('STATUS_YR', pa.int64()), ('GIS_AREA', pa.float64()), ('gHM', pa.float64()),
+        ('boundary_x_mean', pa.float64()), ('boundary_x_stdDev', pa.float64()), ('boundary_x_count', pa.float64()),
+        ('buffer_x_mean', pa.float64()), ('buffer_x_stdDev', pa.float64()), ('buffer_x_count', pa.float64()),
+    ])
+
+    def __init__(self, bucket, out_dir, partition_cols=('band_name', 'year'), max_workers=16):
+        self.bucket = bucket
+        self.out_dir = out_dir
+        self.partition_cols = list(partition_cols)
+        self.max_workers = max_workers
+        os.makedirs(out_dir, exist_ok=True)
+        self.state_path = os.path.join(out_dir, self.STATE_FILE)
+        self.ingested = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.ingested = json.load(f)
+
+    def _save_state(self):
+        tmp = f'{self.state_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.ingested, f)
+        os.replace(tmp, self.state_path)
+
+    @staticmethod
+    def _stem(name):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+    def _download(self, blob):
+        dtype = {field.name: str for field in self.SCHEMA if pa.types.is_string(field.type)}
+        return blob, pd.read_csv(io.BytesIO(blob.download_as_bytes()), dtype=dtype, keep_default_na=False,
+                                 na_values={name: [''] for name in self.SCHEMA.names if name not in dtype})
+
+    def _table(self, df):
+        """df as an Arrow table with the fixed SCHEMA types, extra columns as strings"""
+        fields = [self.SCHEMA.field(name) if name in self.SCHEMA.names else pa.field(name, pa.string())
+                  for name in df.columns]
+        df = df.astype({name: str for name in df.columns if name not in self.SCHEMA.names})
+        return pa.Table.from_pandas(df, schema=pa.schema(fields), preserve_index=False)
+
+    def _write(self, blob, df):
+        # Drop rows written for an older generation of the same blob
+        for old in self.ingested.get(blob.name, {}).get('files', []):
+            path = os.path.join(self.out_dir, old)
+            if os.path.exists(path):
+                os.remove(path)
+        files = []
+        if not df.empty:
+            pq.write_to_dataset(self._table(df), self.out_dir, partition_cols=self.partition_cols,
+                                basename_template=f'{self._stem(blob.name)}-{blob.generation}-{{i}}.parquet',
+                                file_visitor=lambda written: files.append(
+                                    os.path.relpath(written.path, self.out_dir).replace(os.sep, '/')))
+        self.ingested[blob.name] = {'generation': str(blob.generation), 'files': files}
+
+    def run(self, prefix):
+        """Ingest every new or changed CSV under prefix. Returns the number of blobs ingested."""
+        new_blobs = [blob for blob in self.bucket.list_blobs(prefix=prefix)
+                     if blob.name.endswith('.csv')
+                     and self.ingested.get(blob.name, {}).get('generation') != str(blob.generation)]
+
+        window = self.max_workers * 2
+        count = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = set()
+            for blob in new_blobs:
+                futures.add(executor.submit(self._download, blob))
+                if len(futures) >= window:
+                    done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        self._write(*future.result())
+                        count += 1
+            for future in concurrent.futures.as_completed(futures):
+                self._write(*future.result())
+                count += 1
+        self._save_state()
+        return count
+
+    def read(self, **kwargs):
+        """Read the combined dataset back as a DataFrame"""
+        return pd.read_parquet(self.out_dir, **kwargs)
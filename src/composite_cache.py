@@ -0,0 +1,131 @@
+import os
+import json
+import math
+import threading
+import ee
+
+
+TILE_DEGREES = 5
+COMPOSITE_INDEX = 'composite_index.json'
+METERS_PER_DEGREE = 111320
+
+
+def tile_label(tile, tile_degrees=TILE_DEGREES):
+    """Name of a grid tile from its lower-left corner, e.g. (2, -1) -> 'E010S05'"""
+    ix, iy = tile
+    lon, lat = ix * tile_degrees, iy * tile_degrees
+    return f"{'E' if lon >= 0 else 'W'}{abs(lon):03d}{'N' if lat >= 0 else 'S'}{abs(lat):02d}"
+
+
+def tiles_for_bounds(bounds, tile_degrees=TILE_DEGREES):
+    """Grid tiles (ix, iy) intersecting a (minx, miny, maxx, maxy) box in degrees"""
+    minx, miny, maxx, maxy = bounds
+    return [(ix, iy)
+            for ix in range(math.floor(minx / tile_degrees), math.floor(maxx / tile_degrees) + 1)
+            for iy in range(math.floor(miny / tile_degrees), math.floor(maxy / tile_degrees) + 1)]
+
+
+class CompositeCache:
+    """
+    Annual MODIS median composites with NDVI/BSI, exported once per (grid tile, year) to Earth Engine
+    image assets under asset_root, so overlapping and neighbouring PAs read the same pixels instead of
+    recomputing them. The local JSON index at index_path records which (tile, year) assets exist, and
+    pa_tiles maps each protected area to the tiles its buffered bounds touch.
+    """
+
+    def __init__(self, asset_root, index_path=COMPOSITE_INDEX, tile_degrees=TILE_DEGREES, scale=500):
+        self.asset_root = asset_root
+        self.index_path = index_path
+        self.tile_degrees = tile_degrees
+        self.scale = scale
+        self.pa_tiles = {}
+        self._lock = threading.Lock()
+        try:
+            with open(index_path) as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+
+    def _key(self, tile, year):
+        return f'{tile_label(tile, self.tile_degrees)}_{int(year)}'
+
+    def asset_id(self, tile, year):
+        return f'{self.asset_root}/modis_{self._key(tile, year)}'
+
+    def has(self, tile, year):
+        return self._key(tile, year) in self.index
+
+    def record(self, tile, year):
+        """Mark the asset of (tile, year) as exported and write the index"""
+        with self._lock:
+            self.index[self._key(tile, year)] = self.asset_id(tile, year)
+            tmp = f'{self.index_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.index, f)
+            os.replace(tmp, self.index_path)
+
+    def sync(self):
+        """Rebuild the index from the assets under asset_root (one listing call)"""
+        prefix = f'{self.asset_root}/modis_'
+        assets = ee.data.listAssets({'parent': self.asset_root}).get('assets', [])
+        ids = {a.get('id') or a.get('name') for a in assets}
+        with self._lock:
+            self.index = {asset_id[len(prefix):]: asset_id for asset_id in ids if asset_id.startswith(prefix)}
+        return len(self.index)
+
+    def assign_tiles(self, wdpaids, buffer_distance=10000):
+        """
+        Fill pa_tiles for wdpaids from their bounds in the local WDPA store, grown by buffer_distance.
+        Returns {WDPA_PID: [tiles]}.
+        """
+        from config import read_wdpa_store
+        gdf = read_wdpa_store([str(w) for w in wdpaids], columns=['WDPA_PID', 'geometry'])
+        for pid, (minx, miny, maxx, maxy) in zip(gdf['WDPA_PID'], gdf.geometry.bounds.values):
+            lat = max(abs(miny), abs(maxy))
+            dx = buffer_distance / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+            dy = buffer_distance / METERS_PER_DEGREE
+            self.pa_tiles[str(pid)] = tiles_for_bounds((minx - dx, miny - dy, maxx + dx, maxy + dy), self.tile_degrees)
+        return {str(w): self.pa_tiles.get(str(w), []) for w in wdpaids}
+
+    def missing(self, pairs):
+        """(tile, year) composites still to export for (wdpaid, year) pairs, sorted by tile then year"""
+        needed = {(tile, int(year)) for wdpaid, year in pairs for tile in self.pa_tiles.get(str(wdpaid), [])}
+        return sorted(key for key in needed if not self.has(*key))
+
+    def export_task(self, tile, year, img_ops):
+        """Unstarted export of the composite with indices of one (tile, year) to its asset"""
+        ix, iy = tile
+        d = self.tile_degrees
+        region = ee.Geometry.Rectangle([ix * d, iy * d, (ix + 1) * d, (iy + 1) * d], 'EPSG:4326', False)
+        image = img_ops.add_indices_to_image(img_ops.annual_composite(region, year)).toFloat()
+        return ee.batch.Export.image.toAsset(
+            image=image.set('year', int(year), 'tile', tile_label(tile, d)),
+            description=f'modis_{self._key(tile, year)}',
+            assetId=self.asset_id(tile, year),
+            region=region,
+            scale=self.scale,
+            crs='EPSG:4326',
+            maxPixels=1e13
+        )
+
+    def composite(self, wdpaid, year):
+        """Mosaic of the cached tiles of wdpaid for year, or None unless every tile is cached"""
+        tiles = self.pa_tiles.get(str(wdpaid))
+        if not tiles or not all(self.has(tile, year) for tile in tiles):
+            return None
+        return ee.ImageCollection([ee.Image(self.asset_id(tile, year)) for tile in tiles]).mosaic()
+
+    def composites(self, wdpaid, years):
+        """ee.ImageCollection of cached mosaics with a 'year' property, or None unless all years are cached"""
+        images = [self.composite(wdpaid, year) for year in years]
+        if any(image is None for image in images):
+            return None
+        return ee.ImageCollection([image.set('year', int(year)) for image, year in zip(images, years)])
+
+    def order_by_tile(self, pairs):
+        """
+        (wdpaid, year) pairs ordered so that PAs sharing tiles run next to each other: by the first
+        tile of each PA, then PA, then year. PAs without tiles go last.
+        """
+        far = (math.inf, math.inf)
+        return sorted(pairs, key=lambda p: (min(self.pa_tiles.get(str(p[0])) or [far]), str(p[0]), int(p[1])))
@@ -1,8 +1,9 @@
 import ee
 import os
-import pandas as pd
-import geopandas as gpd
 import json
+
+# pandas and geopandas are imported inside the functions that need them so that
+# task workers importing this module for load_protected_area start quickly.
         
 def remove_high_perimeter_area_ratio(features):
     """Calculate perimeter to area ratio and filter out narrow features in top 25%"""
@@ -15,19 +16,54 @@ def remove_high_perimeter_area_ratio(features):
     
     return features_with_ratio, narrow_filter
 
-def load_protected_area(name):
-    """Load a protected area by name from the WDPA dataset"""
+# WDPA selection rules, shared by the server-side filter and the local eligibility check
+EXCLUDED_DESIGNATIONS = ["Marine Protected Area", "UNESCO-MAB Biosphere Reserve"]
+ALLOWED_STATUS = ["Designated", "Established", "Inscribed"]
+MIN_GIS_AREA = 200
+EXCLUDED_PIDS = ["555655917", "555656005", "555656013", "555665477", "555656021",
+                 "555665485", "555556142", "187", "555703455", "555563456", "15894"]
+SELECTION_COLUMNS = ['WDPA_PID', 'MARINE', 'STATUS', 'DESIG_ENG', 'GIS_AREA']
+
+
+def eligible_mask(attrs):
+    """Vectorized WDPA selection rules over an attribute table, returns a boolean Series"""
+    import pandas as pd
+    return (
+        (attrs['MARINE'].astype(str) == "0")
+        & ~attrs['DESIG_ENG'].isin(EXCLUDED_DESIGNATIONS)
+        & attrs['STATUS'].isin(ALLOWED_STATUS)
+        & ~attrs['WDPA_PID'].astype(str).isin(EXCLUDED_PIDS)
+        & (pd.to_numeric(attrs['GIS_AREA'], errors='coerce') >= MIN_GIS_AREA)
+    )
+
+
+def filter_eligible(wdpaids, attrs):
+    """Keep only the IDs that pass the selection rules in the attribute table, preserving order"""
+    eligible = set(attrs.loc[eligible_mask(attrs), 'WDPA_PID'].astype(str))
+    kept = [w for w in wdpaids if str(w) in eligible]
+    rejected = len(wdpaids) - len(kept)
+    if rejected:
+        print(f"Rejected {rejected} ineligible protected areas before submission")
+    return kept
+
+
+def load_protected_area(name, prefiltered=False):
+    """
+    Load a protected area by name from the WDPA dataset.
+    With prefiltered=True the caller has already checked eligibility locally
+    (see filter_eligible), so only a direct PID lookup is added to the graph.
+    """
     protected_areas = ee.FeatureCollection("WCMC/WDPA/202106/polygons")
+    if prefiltered:
+        return protected_areas.filter(ee.Filter.eq('WDPA_PID', name)).first()
     
     # Define basic filters
     marine_filter = ee.Filter.eq("MARINE", "0")
-    not_mpa_filter = ee.Filter.neq("DESIG_ENG", "Marine Protected Area")
-    status_filter = ee.Filter.inList("STATUS", ["Designated", "Established", "Inscribed"])
-    designation_filter = ee.Filter.neq("DESIG_ENG", "UNESCO-MAB Biosphere Reserve")
-    area_filter = ee.Filter.gte("GIS_AREA", 200)
-    excluded_pids = ["555655917", "555656005", "555656013", "555665477", "555656021",
-                    "555665485", "555556142", "187", "555703455", "555563456", "15894"]
-    pids_filter = ee.Filter.inList("WDPA_PID", excluded_pids).Not()
+    not_mpa_filter = ee.Filter.neq("DESIG_ENG", EXCLUDED_DESIGNATIONS[0])
+    status_filter = ee.Filter.inList("STATUS", ALLOWED_STATUS)
+    designation_filter = ee.Filter.neq("DESIG_ENG", EXCLUDED_DESIGNATIONS[1])
+    area_filter = ee.Filter.gte("GIS_AREA", MIN_GIS_AREA)
+    pids_filter = ee.Filter.inList("WDPA_PID", EXCLUDED_PIDS).Not()
    
     
     # Combine all filters
@@ -47,9 +83,110 @@ def load_protected_area(name):
     
     return pa
 
+
+WDPA_SHP = '../data/global_wdpa_June2021/Global_wdpa_footprint_June2021.shp'
+WDPA_STORE = '../data/global_wdpa_June2021/Global_wdpa_footprint_June2021.parquet'
+
+
+def pid_index_path(store_path=WDPA_STORE):
+    """Path of the WDPA_PID -> row groups index written next to the GeoParquet store"""
+    return f'{store_path}.pid_index.json'
+
+
+def build_wdpa_store(shp_path=WDPA_SHP, store_path=WDPA_STORE, row_group_size=1000):
+    """
+    Convert the global WDPA shapefile into a GeoParquet store, done once.
+    Rows are ordered along a Hilbert curve so every row group covers a compact area, and a bbox
+    covering column is written, so spatial queries skip non-overlapping row groups. A sidecar
+    JSON index maps each WDPA_PID to its row groups for attribute lookups.
+    """
+    import geopandas as gpd
+    gdf = gpd.read_file(shp_path).to_crs('EPSG:4326')
+    gdf['WDPA_PID'] = gdf['WDPA_PID'].astype(str)
+    gdf = gdf.iloc[gdf.geometry.hilbert_distance().argsort(kind='stable')].reset_index(drop=True)
+    gdf.to_parquet(store_path, row_group_size=row_group_size, write_covering_bbox=True)
+
+    index = {}
+    for row, pid in enumerate(gdf['WDPA_PID']):
+        groups = index.setdefault(pid, [])
+        if row // row_group_size not in groups:
+            groups.append(row // row_group_size)
+    with open(pid_index_path(store_path), 'w') as f:
+        json.dump(index, f)
+    return store_path
+
+
+def _row_properties(row, columns):
+    """Clean a GeoDataFrame row into string properties for an EE Feature"""
+    import pandas as pd
+    properties = {}
+    for col in columns:
+        if col != 'geometry' and pd.notnull(row[col]):
+            val = row[col]
+            # Convert numpy/pandas types to Python native types
+            if hasattr(val, 'item'):
+                val = val.item()
+            properties[col] = str(val)
+    return properties
+
+
+def read_wdpa_store(wdpa_ids=None, bbox=None, store_path=WDPA_STORE, columns=None):
+    """
+    Read matching rows from the GeoParquet store by WDPA_PID list and/or (minx, miny, maxx, maxy) bbox.
+    ID lookups read only the row groups the PID index lists; bbox queries prune row groups by their bbox.
+    """
+    import geopandas as gpd
+    if wdpa_ids is None or not os.path.exists(pid_index_path(store_path)):
+        filters = [('WDPA_PID', 'in', [str(i) for i in wdpa_ids])] if wdpa_ids is not None else None
+        return gpd.read_parquet(store_path, columns=columns, filters=filters, bbox=bbox)
+
+    import pyarrow.parquet as pq
+    from shapely.geometry import box
+    ids = [str(i) for i in wdpa_ids]
+    with open(pid_index_path(store_path)) as f:
+        index = json.load(f)
+    groups = sorted({group for i in ids for group in index.get(i, [])})
+    parquet = pq.ParquetFile(store_path)
+    read = None if columns is None else list(dict.fromkeys(list(columns) + ['WDPA_PID', 'geometry']))
+    if read is None:
+        read = [name for name in parquet.schema_arrow.names if name != 'bbox']
+    df = parquet.read_row_groups(groups, columns=read).to_pandas() if groups else \
+        parquet.schema_arrow.empty_table().select(read).to_pandas()
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.GeoSeries.from_wkb(df['geometry'], crs='EPSG:4326'))
+    gdf = gdf[gdf['WDPA_PID'].isin(ids)]
+    if bbox is not None:
+        gdf = gdf[gdf.intersects(box(*bbox))]
+    return gdf[columns].reset_index(drop=True) if columns is not None else gdf.reset_index(drop=True)
+
+
+def load_local_data_many(wdpa_ids, store_path=WDPA_STORE, as_geojson=False):
+    """
+    Load many protected areas from the local GeoParquet store in one pass.
+    Returns {WDPA_PID: ee.Feature}, or {WDPA_PID: GeoJSON Feature dict} if as_geojson.
+    """
+    gdf = read_wdpa_store(wdpa_ids, store_path=store_path)
+    missing = set(map(str, wdpa_ids)) - set(gdf['WDPA_PID'])
+    if missing:
+        raise ValueError(f"Protected areas not found: {sorted(missing)}")
+
+    features = {}
+    for _, row in gdf.drop_duplicates('WDPA_PID').iterrows():
+        geojson = row.geometry.__geo_interface__
+        properties = _row_properties(row, gdf.columns)
+        if as_geojson:
+            features[row['WDPA_PID']] = {'type': 'Feature', 'geometry': geojson, 'properties': properties}
+        else:
+            features[row['WDPA_PID']] = ee.Feature(ee.Geometry(geojson), properties)
+    return features
+
+
 def load_local_data(wdpa_id):
-    """Load protected area from local shapefile and convert to EE Feature"""
-    shp_path = '../data/global_wdpa_June2021/Global_wdpa_footprint_June2021.shp'
+    """Load protected area from local data and convert to EE Feature"""
+    if os.path.exists(WDPA_STORE):
+        return load_local_data_many([wdpa_id])[str(wdpa_id)]
+
+    import geopandas as gpd
+    shp_path = WDPA_SHP
     try:
         # Read shapefile
         gdf = gpd.read_file(shp_path)
@@ -69,14 +206,7 @@ def load_local_data(wdpa_id):
         ee_geometry = ee.Geometry(geojson)
         
         # Clean properties for EE Feature
-        properties = {}
-        for col in pa_gdf.columns:
-            if col != 'geometry' and pd.notnull(pa_row[col]):
-                val = pa_row[col]
-                # Convert numpy/pandas types to Python native types
-                if hasattr(val, 'item'):
-                    val = val.item()
-                properties[col] = str(val)
+        properties = _row_properties(pa_row, pa_gdf.columns)
         
         return ee.Feature(ee_geometry, properties)
         
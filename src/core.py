@@ -0,0 +1,363 @@
+import ee
+
+
+WATER_MODES = ('vector', 'raster')
+
+
+class GeometryOperations:
+    """
+    water_mode='vector' cuts water polygons out of the AOI geometry (mask_water);
+    water_mode='raster' keeps the plain donut and masks water pixels in the images instead (mask_image).
+    With a donut_store (donuts.DonutStore), precomputed local donuts replace the server-side buffers.
+    """
+
+    def __init__(self, max_error=1, aoi_cache=None, water_mode='vector', scale=500, donut_store=None):
+        if water_mode not in WATER_MODES:
+            raise ValueError(f"water_mode must be one of {WATER_MODES}, got {water_mode!r}")
+        self.max_error = max_error
+        self.water_asset = "JRC/GSW1_0/GlobalSurfaceWater"
+        self.water_mask = ee.Image(self.water_asset)
+        self.aoi_cache = aoi_cache
+        self.water_mode = water_mode
+        self.scale = scale
+        self.donut_store = donut_store
+
+    def buffer_polygon(self, geom, buffer_distance=10000):
+        """Create buffer around polygon"""
+        out = geom.buffer(buffer_distance)
+        inn = geom.buffer(-buffer_distance)
+        aoi = out.difference(inn, self.max_error)
+        return aoi
+
+    def donut(self, wdpaid, geom, buffer_distance=10000):
+        """Precomputed donut of wdpaid from the donut store when it has one, otherwise buffer_polygon"""
+        if self.donut_store is not None and wdpaid is not None:
+            stored = self.donut_store.get(wdpaid, buffer_distance)
+            if stored is not None:
+                return stored
+        return self.buffer_polygon(geom, buffer_distance)
+
+    def water_image(self):
+        """JRC maximum water extent with small gaps closed (1 = water)"""
+        return self.water_mask.select('max_extent')\
+            .focalMax(radius=30, units='meters', kernelType='square')\
+            .focalMin(radius=30, units='meters', kernelType='square')
+
+    def land_mask(self, max_water_fraction=0.5):
+        """Mask at analysis scale: 1 where at most max_water_fraction of the pixel is (smoothed) water"""
+        water = self.water_image().unmask(0)
+        fraction = water.reduceResolution(reducer=ee.Reducer.mean(), maxPixels=1024)\
+            .reproject(self.water_mask.projection().atScale(self.scale))
+        return fraction.lte(max_water_fraction)
+
+    def mask_image(self, image):
+        """Mask water pixels of image in raster mode; vector mode already cut water out of the AOI"""
+        if self.water_mode == 'raster':
+            return image.updateMask(self.land_mask())
+        return image
+
+    def mask_water(self, feat):
+        """Mask water bodies from feature"""
+        water_no_holes = self.water_image()
+        water_vect = water_no_holes.reduceToVectors(
+            reducer=ee.Reducer.countEvery(),
+            geometry=feat.buffer(1000),
+            scale=30,
+            maxPixels=1e10,
+            geometryType='polygon',
+            eightConnected=False)
+        geom = feat.difference(water_vect.geometry(), maxError=self.max_error)
+        return geom
+    
+    def masked_aoi(self, wdpaid, geom, buffer_distance=10000):
+        """
+        Buffered AOI, water-masked in vector mode (in raster mode water is masked in the images),
+        served from the local AOI cache when one is set
+        """
+        if self.water_mode == 'raster':
+            compute = lambda: self.donut(wdpaid, geom, buffer_distance)
+        else:
+            compute = lambda: self.mask_water(self.donut(wdpaid, geom, buffer_distance))
+        if self.aoi_cache is None:
+            return compute()
+        return self.aoi_cache.get_or_compute(self.aoi_key(wdpaid, buffer_distance), compute)
+
+    def aoi_key(self, wdpaid, buffer_distance=10000):
+        """Everything masked_aoi of wdpaid depends on: buffer, max_error, water mode or dataset, local donut"""
+        water_key = 'raster' if self.water_mode == 'raster' else self.water_asset
+        key = [str(wdpaid), buffer_distance, self.max_error, water_key]
+        if self.donut_store is not None and (wdpaid, buffer_distance) in self.donut_store:
+            key.append(f'local_donut_{self.donut_store.tolerance}')
+        return key
+
+    def get_biome(self, geom): 
+        """Get biome with largest overlap for a feature, add BIOME_NAME property"""
+        ecoregions = ee.FeatureCollection("RESOLVE/ECOREGIONS/2017")
+        intersecting = ecoregions.map(lambda eco: eco.set(
+            'intersection_area', 
+            eco.geometry().intersection(geom).area()
+        )).filterBounds(geom)
+        largest_ecoregion = intersecting.sort('intersection_area', False).first()
+        biome_name = ee.Algorithms.If(
+            largest_ecoregion,
+            largest_ecoregion.get('BIOME_NAME'),
+            ee.String('Unknown')
+        )
+        return biome_name
+        
+
+class ImageOperations:
+    def __init__(self, composite_cache=None):
+        self.modis = ee.ImageCollection('MODIS/006/MOD09A1')
+        self.composite_cache = composite_cache
+
+    def filter_for_year(self, feat, year):
+        """Filter images for specific year"""
+        start = ee.Date.fromYMD(year, 1, 1)
+        return ee.Filter.And(
+            ee.Filter.bounds(feat),
+            ee.Filter.date(start, start.advance(1, "year"))
+        )
+
+    def annual_composite(self, aoi, year):
+        """Median MODIS composite for one year, clipped to the AOI"""
+        modis_ic = self.modis.filter(self.filter_for_year(aoi, year))
+        band_names = modis_ic.first().bandNames()
+        return modis_ic.reduce(ee.Reducer.median()).rename(band_names).clip(aoi)
+
+    def indexed_composite(self, aoi, year, wdpaid=None):
+        """
+        Annual composite with NDVI/BSI clipped to the AOI, read from the composite cache
+        (composite_cache.CompositeCache) when it holds every tile of wdpaid for year
+        """
+        if self.composite_cache is not None and wdpaid is not None:
+            cached = self.composite_cache.composite(wdpaid, year)
+            if cached is not None:
+                return cached.clip(aoi)
+        return self.add_indices_to_image(self.annual_composite(aoi, year))
+
+    def add_indices_to_image(self, image):
+        """Add vegetation indices to image"""
+        NDVI = image.expression(
+            "(NIR - RED) / (NIR + RED)",
+            {
+                'NIR': image.select("sur_refl_b02"),
+                'RED': image.select("sur_refl_b01")
+            }
+        ).rename("NDVI")
+
+        BSI = image.expression(
+            "((SWIR2 + RED) - (NIR + BLUE)) / ((SWIR2 + RED) + (NIR + BLUE))",
+            {
+                'SWIR2': image.select("sur_refl_b07"),
+                'RED': image.select("sur_refl_b01"), 
+                'NIR': image.select("sur_refl_b02"),
+                'BLUE': image.select("sur_refl_b03")
+            }
+        ).rename("BSI")
+
+        return image.addBands([NDVI, BSI])
+
+    def get_gradient_magnitude(self, image):
+        """Calculate gradient magnitude"""
+        gradient = image.gradient()
+        gradient_x = gradient.select('x')
+        gradient_y = gradient.select('y')
+        magnitude = gradient_x.pow(2).add(gradient_y.pow(2)).sqrt()
+        return magnitude
+
+
+# Reduction settings tried in turn when an export runs out of memory: a higher tileScale first,
+# then tiled reductions over ever smaller grid tiles (tile_size in meters, a multiple of the 500 m scale)
+REDUCTION_LEVELS = [
+    {'tile_size': None, 'tile_scale': 1},
+    {'tile_size': None, 'tile_scale': 4},
+    {'tile_size': 100000, 'tile_scale': 4},
+    {'tile_size': 25000, 'tile_scale': 16},
+]
+
+
+class StatsOperations:
+    """
+    With tile_size set, gradient statistics are reduced per grid tile of tile_size meters and merged
+    server-side (see tiled_gradient_statistics). tile_scale is passed to every reduction.
+    """
+
+    def __init__(self, tile_size=None, tile_scale=1, scale=500):
+        self.gHM_collection = ee.ImageCollection('CSP/HM/GlobalHumanModification')
+        self.gHM_mean = self.gHM_collection.mean()
+        self.tile_size = tile_size
+        self.tile_scale = tile_scale
+        self.scale = scale
+
+    def stats_reducer(self):
+        """
+        mean, stdDev and count with shared inputs, unweighted: count never weights pixels by their
+        fractional coverage, so mean and stdDev must not either for the tile merge to be exact
+        """
+        return ee.Reducer.mean().combine(
+            reducer2=ee.Reducer.stdDev(),
+            sharedInputs=True
+        ).combine(
+            reducer2=ee.Reducer.count(),
+            sharedInputs=True
+        ).unweighted()
+
+    def calculate_gradient_statistics(self, layer, name='buffer', geometry=None, band_names=None):
+        """
+        Calculate mean and standard deviation of gradient magnitude, per band of layer.
+        Tiled when tile_size is set and the band names are given.
+        """
+        if self.tile_size and band_names:
+            return self.tiled_gradient_statistics(layer, band_names, geometry or layer.geometry())
+        stats = layer.reduceRegion(
+            reducer=self.stats_reducer(),
+            geometry=geometry or layer.geometry(),
+            scale=self.scale,
+            maxPixels=1e10,
+            tileScale=self.tile_scale
+        )
+        return stats
+
+    def tiled_gradient_statistics(self, layer, band_names, geometry):
+        """
+        Same ee.Dictionary as calculate_gradient_statistics, from one reduceRegions over the grid tiles
+        covering geometry. Tiles follow the 500 m pixel grid, so no pixel is split between tiles, and
+        per-tile count/mean/stdDev are merged with the parallel (Chan et al.) variance formulas:
+        n = sum(n_i), mean = sum(n_i * mean_i) / n, M2 = sum(n_i * sd_i^2 + n_i * (mean_i - mean)^2).
+        The layer is expected to be clipped to geometry already, so the tiles themselves stay simple.
+        """
+        tiles = geometry.coveringGrid('EPSG:4326', self.tile_size)
+        per_tile = layer.reduceRegions(
+            collection=tiles,
+            reducer=self.stats_reducer(),
+            scale=self.scale,
+            crs='EPSG:4326',
+            tileScale=self.tile_scale
+        )
+
+        def merge(band):
+            valid = per_tile.filter(ee.Filter.gt(f'{band}_count', 0))
+            n = ee.Array(valid.aggregate_array(f'{band}_count'))
+            means = ee.Array(valid.aggregate_array(f'{band}_mean'))
+            sds = ee.Array(valid.aggregate_array(f'{band}_stdDev'))
+            total = n.reduce(ee.Reducer.sum(), [0]).get([0])
+            mean = n.multiply(means).reduce(ee.Reducer.sum(), [0]).get([0]).divide(total)
+            m2 = n.multiply(sds.pow(2)).add(n.multiply(means.subtract(mean).pow(2)))\
+                .reduce(ee.Reducer.sum(), [0]).get([0])
+            merged = ee.Dictionary({f'{band}_mean': mean, f'{band}_stdDev': m2.divide(total).sqrt(),
+                                    f'{band}_count': total})
+            empty = ee.Dictionary({f'{band}_count': 0})
+            return ee.Dictionary(ee.Algorithms.If(valid.size().gt(0), merged, empty))
+
+        stats = ee.Dictionary({})
+        for band in band_names:
+            stats = stats.combine(merge(band))
+        return stats
+
+    def get_gHM(self, geom, scale=500, image=None):
+        """Return mean Global Human Modification value for a geometry as an ee.Number. image overrides the gHM mean (e.g. water-masked)."""
+        image = image if image is not None else self.gHM_mean
+        gHM_dict = image.reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=geom,
+            scale=scale,
+            maxPixels=1e9
+        )
+        return ee.Algorithms.If(
+            gHM_dict.contains('gHM'),
+            gHM_dict.get('gHM'),
+            ee.Number(-9999)
+        )
+
+
+class FeatureProcessor:
+    def __init__(self, geo_ops, img_ops, stats_ops, biome_lookup=None, pa_attributes=None):
+        self.geo_ops = geo_ops
+        self.img_ops = img_ops
+        self.stats_ops = stats_ops
+        self.biome_lookup = biome_lookup or {}
+        self.pa_attributes = pa_attributes if pa_attributes is not None else {}
+        self.bands_to_process = ['NDVI', 'BSI']#['sur_refl_b01', 'sur_refl_b02', 'sur_refl_b03', 'sur_refl_b04', 'NDVI', 'BSI']
+        
+    def get_biome(self, geom, wdpaid=None):
+        """Biome from the precomputed lookup table when available, otherwise the EE expression"""
+        if wdpaid is not None and str(wdpaid) in self.biome_lookup:
+            return self.biome_lookup[str(wdpaid)]
+        return self.geo_ops.get_biome(geom)
+
+    def collect_feature_info(self, pa, geom, wdpaid=None):
+        """
+        Collect basic protected area feature information.
+        Uses the cached attributes of wdpaid (a PAAttributeCache or dict) as constants when available.
+        """
+        cached = self.pa_attributes.get(str(wdpaid)) if wdpaid is not None else None
+        if cached is not None:
+            return {key: cached.get(key) for key in
+                    ['WDPA_PID', 'ORIG_NAME', 'GOV_TYPE', 'OWN_TYPE', 'STATUS_YR', 'IUCN_CAT', 'GIS_AREA', 'gHM', 'BIOME_NAME']}
+        return {
+            'WDPA_PID': pa.get('WDPA_PID'),
+            'ORIG_NAME': pa.get('ORIG_NAME'),
+            'GOV_TYPE': pa.get('GOV_TYPE'), 
+            'OWN_TYPE': pa.get('OWN_TYPE'),
+            'STATUS_YR': pa.get('STATUS_YR'),
+            'IUCN_CAT': pa.get('IUCN_CAT'),
+            'GIS_AREA': pa.get('GIS_AREA'),
+            'gHM': self.stats_ops.get_gHM(geom, image=self.geo_ops.mask_image(self.stats_ops.gHM_mean)),
+            'BIOME_NAME': self.get_biome(geom, wdpaid),
+        }
+    
+    def process_all_bands_ee(self, image, pa_geometry, aoi, feature_info, year, wdpaid=None):
+        """
+        Process all bands and return a list of ee.Feature (one per band).
+        Gradient magnitudes of every band are stacked into one image, with a boundary and a buffer copy
+        of each, so all bands' boundary and buffer statistics come from a single reduceRegion.
+        """
+        bands = self.bands_to_process
+        magnitudes = self.geo_ops.mask_image(ee.Image.cat([
+            self.img_ops.get_gradient_magnitude(image.select(band_name)).rename(band_name)
+            for band_name in bands
+        ]).clip(aoi))
+        boundary = self.geo_ops.donut(wdpaid, pa_geometry, 1000)
+        zones = magnitudes.rename([f'buffer_{b}' for b in bands])\
+            .addBands(magnitudes.clip(boundary).rename([f'boundary_{b}' for b in bands]))
+
+        # One reduction over the AOI; boundary bands are masked outside the 1 km boundary donut
+        zone_bands = [f'{zone}_{b}' for zone in ['buffer', 'boundary'] for b in bands]
+        stats = self.stats_ops.calculate_gradient_statistics(zones, geometry=aoi, band_names=zone_bands)
+
+        features = []
+        for band_name in bands:
+            # Combine all info into an ee.Feature
+            props = {
+                'WDPA_PID': feature_info['WDPA_PID'],
+                'ORIG_NAME': feature_info['ORIG_NAME'],
+                'BIOME_NAME': feature_info['BIOME_NAME'],
+                'GOV_TYPE': feature_info['GOV_TYPE'], 
+                'OWN_TYPE': feature_info['OWN_TYPE'],
+                'STATUS_YR': feature_info['STATUS_YR'],
+                'IUCN_CAT': feature_info['IUCN_CAT'],
+                'GIS_AREA': feature_info['GIS_AREA'],
+                'gHM': feature_info['gHM'],
+                'year': year,
+                'band_name': band_name,
+                **{f"{zone}_x_{k}": stats.get(f"{zone}_{band_name}_{k}")
+                   for zone in ['boundary', 'buffer'] for k in ['mean', 'stdDev', 'count']}
+            }
+            features.append(ee.Feature(None, props))
+        return features
+
+    def process_years_ee(self, pa_geometry, aoi, feature_info, years, wdpaid=None):
+        """Map composite, indices and band statistics over a list of years server-side, return one ee.FeatureCollection"""
+        cache = self.img_ops.composite_cache
+        cached = cache.composites(wdpaid, years) if cache is not None and wdpaid is not None else None
+
+        def by_year(year):
+            year = ee.Number(year).int()
+            if cached is not None:
+                image = self.geo_ops.mask_image(ee.Image(cached.filter(ee.Filter.eq('year', year)).first()).clip(aoi))
+            else:
+                composite = self.geo_ops.mask_image(self.img_ops.annual_composite(aoi, year))
+                image = self.img_ops.add_indices_to_image(composite)
+            return ee.FeatureCollection(self.process_all_bands_ee(image, pa_geometry, aoi, feature_info, year, wdpaid))
+        return ee.FeatureCollection(ee.List(years).map(by_year)).flatten()
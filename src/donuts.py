@@ -0,0 +1,133 @@
+import time
+import concurrent.futures
+import ee
+from biomes import local_donuts
+
+
+DONUT_STORE = '../data/donuts.parquet'
+DONUT_DISTANCES = (10000, 1000)
+
+
+def _donut_chunk(pas, distances, tolerance):
+    """
+    +/- distance donuts for one chunk of PAs (GeoDataFrame in EPSG:4326), with vertex counts and
+    seconds per donut. Each PA is buffered by biomes.local_donuts in an equidistant projection
+    centred on it, so the rings are true distances at any latitude, and simplified so the stored
+    donut is within tolerance meters of the exact one.
+    """
+    import shapely
+    import pandas as pd
+    import geopandas as gpd
+    geom = pas.geometry.make_valid()
+    frames = []
+    for distance in distances:
+        start = time.perf_counter()
+        donuts = local_donuts(geom.values, [distance], tolerance)[distance]
+        frames.append(gpd.GeoDataFrame({
+            'WDPA_PID': pas['WDPA_PID'].values,
+            'distance': distance,
+            'vertices_pa': shapely.get_num_coordinates(geom.values),
+            'vertices': shapely.get_num_coordinates(donuts),
+            'seconds': (time.perf_counter() - start) / len(pas),
+        }, geometry=donuts, crs='EPSG:4326'))
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_donut_store(pa_gdf, out_path=DONUT_STORE, distances=DONUT_DISTANCES, tolerance=100,
+                      chunk_size=200, max_workers=None):
+    """
+    Compute the buffer (10 km) and boundary (1 km) donuts of every PA in pa_gdf (needs WDPA_PID and
+    geometry) locally, once: buffered in a local equidistant projection per PA across a process pool,
+    simplified to tolerance meters and written to a GeoParquet file read by DonutStore.
+    Returns the stored GeoDataFrame, with per-donut vertex counts and seconds (see donut_report).
+    """
+    import pandas as pd
+    import geopandas as gpd
+    pas = pa_gdf[['WDPA_PID', 'geometry']].to_crs('EPSG:4326')
+    pas['WDPA_PID'] = pas['WDPA_PID'].astype(str)
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_donut_chunk, pas.iloc[start:start + chunk_size], distances, tolerance)
+                   for start in range(0, len(pas), chunk_size)]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+
+    donuts = gpd.GeoDataFrame(pd.concat(results, ignore_index=True), crs='EPSG:4326') if results else \
+        gpd.GeoDataFrame(columns=['WDPA_PID', 'distance', 'geometry'], geometry='geometry', crs='EPSG:4326')
+    donuts['tolerance'] = tolerance
+    donuts = donuts.sort_values(['WDPA_PID', 'distance'], ignore_index=True)
+    donuts.to_parquet(out_path, index=False)
+    return donuts
+
+
+def donut_report(donuts):
+    """
+    Vertex counts of the PA outlines and of the stored donuts, and build seconds (summed over workers),
+    per donut distance. A server-side donut has at least the vertices of the outline it was buffered
+    from, so vertices_pa / vertices is a lower bound on the reduction.
+    """
+    report = donuts.groupby('distance').agg(
+        donuts=('WDPA_PID', 'size'),
+        vertices_pa=('vertices_pa', 'sum'),
+        vertices=('vertices', 'sum'),
+        max_vertices=('vertices', 'max'),
+        seconds=('seconds', 'sum'),
+    )
+    report['reduction'] = report['vertices_pa'] / report['vertices']
+    return report
+
+
+def compare_with_ee(store, wdpaids, distance=1000, prefiltered=False, max_error=1):
+    """
+    Check stored donuts against the server-side (geodesic) donuts of GeometryOperations.buffer_polygon.
+    Returns a DataFrame per PA with both areas and the area of their symmetric difference relative
+    to the EE donut, from one getInfo. Differences should stay near the simplification tolerance.
+    """
+    import pandas as pd
+    from config import load_protected_area
+    from core import GeometryOperations
+    geo_ops = GeometryOperations(max_error=max_error)
+    features = []
+    for wdpaid in wdpaids:
+        local = store.get(wdpaid, distance)
+        if local is None:
+            continue
+        geom = load_protected_area(wdpaid, prefiltered).geometry()
+        exact = geo_ops.buffer_polygon(geom, distance)
+        features.append(ee.Feature(None, {
+            'WDPA_PID': str(wdpaid),
+            'ee_area': exact.area(max_error),
+            'local_area': local.area(max_error),
+            'difference_area': exact.symmetricDifference(local, max_error).area(max_error),
+        }))
+    if not features:
+        return pd.DataFrame(columns=['WDPA_PID', 'ee_area', 'local_area', 'difference_area', 'rel_difference'])
+    df = pd.DataFrame([f['properties'] for f in ee.FeatureCollection(features).getInfo()['features']])
+    df['rel_difference'] = df['difference_area'] / df['ee_area']
+    return df
+
+
+class DonutStore:
+    """
+    Precomputed donuts from build_donut_store, served as ee.Geometry.
+    Only the requested PAs are read from the GeoParquet file; get() returns None for PAs not in it.
+    """
+
+    def __init__(self, path=DONUT_STORE, wdpa_ids=None):
+        import geopandas as gpd
+        filters = [('WDPA_PID', 'in', [str(i) for i in wdpa_ids])] if wdpa_ids is not None else None
+        donuts = gpd.read_parquet(path, columns=['WDPA_PID', 'distance', 'tolerance', 'geometry'], filters=filters)
+        self.path = path
+        self.tolerance = int(donuts['tolerance'].iloc[0]) if len(donuts) else None
+        self.geojson = {(pid, int(distance)): geom.__geo_interface__
+                        for pid, distance, geom in zip(donuts['WDPA_PID'], donuts['distance'], donuts.geometry)}
+
+    def __contains__(self, key):
+        wdpaid, distance = key
+        return (str(wdpaid), int(distance)) in self.geojson
+
+    def get(self, wdpaid, distance):
+        """ee.Geometry of the +/- distance donut of wdpaid, or None"""
+        geojson = self.geojson.get((str(wdpaid), int(distance)))
+        return ee.Geometry(geojson) if geojson is not None else None
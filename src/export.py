@@ -0,0 +1,135 @@
+import io
+import ee
+from datetime import datetime
+
+
+TABLE_FORMATS = {'CSV': '.csv', 'GeoJSON': '.geojson', 'TFRecord': '.tfrecord.gz'}
+DESTINATIONS = ('cloud', 'asset')
+
+# Columns the downstream edge index / trend analysis and visualization notebook read from the stats tables
+ANALYSIS_COLUMNS = ['WDPA_PID', 'ORIG_NAME', 'year', 'band_name', 'BIOME_NAME', 'IUCN_CAT', 'GOV_TYPE',
+                    'OWN_TYPE', 'STATUS_YR', 'GIS_AREA', 'gHM',
+                    'boundary_x_mean', 'boundary_x_stdDev', 'boundary_x_count',
+                    'buffer_x_mean', 'buffer_x_stdDev', 'buffer_x_count']
+
+
+class ExportConfig:
+    """
+    Where and how ExportResults writes its outputs.
+    Tables go to gs://bucket/table_prefix as file_format (CSV, GeoJSON or TFRecord), or with
+    destination='asset' to Earth Engine table assets under asset_root. selectors limits table
+    exports to those columns. Images go to gs://bucket/image_prefix as cloud-optimized GeoTIFFs.
+    """
+
+    def __init__(self, bucket='dse-staff', table_prefix='protected_areas/tables', image_prefix='protected_areas/images',
+                 file_format='CSV', destination='cloud', asset_root=None, selectors=None):
+        if file_format not in TABLE_FORMATS:
+            raise ValueError(f"file_format must be one of {list(TABLE_FORMATS)}, got {file_format!r}")
+        if destination not in DESTINATIONS:
+            raise ValueError(f"destination must be one of {DESTINATIONS}, got {destination!r}")
+        if destination == 'asset' and not asset_root:
+            raise ValueError("destination='asset' needs an asset_root, e.g. 'projects/<project>/assets/protected_areas'")
+        self.bucket = bucket
+        self.table_prefix = table_prefix
+        self.image_prefix = image_prefix
+        self.file_format = file_format
+        self.destination = destination
+        self.asset_root = asset_root
+        self.selectors = selectors
+
+    @property
+    def extension(self):
+        """File extension of exported tables"""
+        return TABLE_FORMATS[self.file_format]
+
+
+class ExportResults: 
+    def __init__(self, config=None):
+        self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.config = config or ExportConfig()
+
+    def table_export(self, collection, name, selectors=None):
+        """
+        Unstarted table export of collection. name is the task description and the file
+        (or asset) name below the configured prefix; it may contain '/' for subfolders in GCS.
+        """
+        config = self.config
+        selectors = selectors or config.selectors
+        description = name.replace('/', '_')
+        if config.destination == 'asset':
+            if selectors:
+                collection = collection.select(selectors, None, False)
+            return ee.batch.Export.table.toAsset(
+                collection=collection,
+                description=description,
+                assetId=f'{config.asset_root}/{description}'
+            )
+        options = {'selectors': selectors} if selectors else {}
+        return ee.batch.Export.table.toCloudStorage(
+            collection=collection,
+            description=description,
+            bucket=config.bucket,
+            fileNamePrefix=f'{config.table_prefix}/{name}',
+            fileFormat=config.file_format,
+            **options
+        )
+
+    def table_task(self, feature_collection, wdpaid, year):
+        """Unstarted export task for the stats table of one protected area and year"""
+        return self.table_export(feature_collection, f'{wdpaid}_{year}')
+
+    def consolidated_task(self, collections, name, selectors=ANALYSIS_COLUMNS):
+        """
+        Unstarted export of many stats tables (e.g. all PA-years of a chunk) as a single table,
+        limited to selectors, so downstream jobs read a few files instead of one per PA-year.
+        """
+        return self.table_export(ee.FeatureCollection(collections).flatten(), name, selectors)
+
+    def export_table_to_cloud(self, feature_collection, wdpaid, year):
+        task = self.table_task(feature_collection, wdpaid, year)
+        task.start()
+        return print(f"Export task started for {wdpaid}, {year}")    
+
+    def image_task(self, image, band_name, wdpaid, year):
+        """Unstarted export task saving an Image as a COG in GCS"""
+        return ee.batch.Export.image.toCloudStorage(
+        image=image,
+        description=f'image_{wdpaid}_{year}',
+        bucket=self.config.bucket, 
+        fileNamePrefix=f'{self.config.image_prefix}/{band_name}_{wdpaid}_{year}',  
+        fileFormat='GeoTIFF', 
+        formatOptions={
+            'cloudOptimized': True,
+            'noData': -9999,  # masked pixels, e.g. outside the boundary zone
+        },
+        maxPixels=1e8,  
+        scale=500  
+        )
+
+    def export_image_to_cloud(self, image, band_name, wdpaid, year):
+        """Save Image as a COG and upload to GCS."""
+        task = self.image_task(image, band_name, wdpaid, year)
+        task.start()
+        return print(f"Export task started for {wdpaid}, {year}") 
+    
+    def combine_gcs_csvs(self, bucket_name, folder_path):
+        """Combine all CSV files from a GCS folder into a single DataFrame."""
+        import pandas as pd
+        from google.cloud import storage
+        bucket = storage.Client(bucket_name).bucket(bucket_name)
+        dfs = [pd.read_csv(io.BytesIO(blob.download_as_bytes()))
+               for blob in bucket.list_blobs(prefix=folder_path) if blob.name.endswith('.csv')]
+        return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+
+    def combine_gcs_csvs_to_parquet(self, bucket_name, folder_path, out_dir, max_workers=16, bucket=None):
+        """
+        Incrementally combine CSVs from a GCS folder into a Parquet dataset partitioned by band_name/year.
+        Only blobs not ingested by an earlier call (by generation) are downloaded. Pass bucket=LocalBucket(dir)
+        to read from a local directory instead of GCS.
+        """
+        from combine import CsvCombiner, gcs_bucket
+        bucket = bucket or gcs_bucket(bucket_name, pool_size=max_workers)
+        combiner = CsvCombiner(bucket, out_dir, max_workers=max_workers)
+        n_new = combiner.run(folder_path)
+        print(f"Ingested {n_new} new CSV files into {out_dir}")
+        return combiner.read()
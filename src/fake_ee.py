@@ -0,0 +1,266 @@
+import os
+import sys
+import random
+import tempfile
+import itertools
+import contextlib
+import ee as real_ee
+from scheduler import FakeTaskBackend, ExportScheduler, EETaskBackend
+
+
+MODIS_BANDS = ['sur_refl_b01', 'sur_refl_b02', 'sur_refl_b03', 'sur_refl_b04',
+               'sur_refl_b05', 'sur_refl_b06', 'sur_refl_b07', 'QA', 'SolarZenith',
+               'ViewZenith', 'RelativeAzimuth', 'StateQA', 'DayOfYear']
+SQUARE = {'type': 'Polygon', 'coordinates': [[[0, 0], [0.1, 0], [0.1, 0.1], [0, 0.1], [0, 0]]]}
+GEOMETRY_OPS = {'Geometry', 'geometry', 'buffer', 'difference', 'intersection', 'union', 'simplify', 'dissolve'}
+
+
+class SimulatedClock:
+    """Clock whose sleep() advances time instantly, for running the scheduler at simulated speed"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class Node:
+    """One recorded call in an expression graph. Any attribute is a method that records a child node."""
+
+    def __init__(self, fake, op, args=(), kwargs=None):
+        self._fake = fake
+        self._op = op
+        self._args = tuple(fake._trace(a) for a in args)
+        self._kwargs = {k: fake._trace(v) for k, v in (kwargs or {}).items()}
+        fake.nodes_created += 1
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: Node(self._fake, name, (self,) + args, kwargs)
+
+    def getInfo(self):
+        return self._fake._get_info(self)
+
+    def __repr__(self):
+        return f'<fake ee {self._op}>'
+
+
+class Namespace:
+    """Stand-in for an ee class or module: calling it or any of its attributes records a node"""
+
+    def __init__(self, fake, name):
+        self._fake = fake
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return Node(self._fake, self._name, args, kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Namespace(self._fake, f'{self._name}.{name}')
+
+
+class FakeTask:
+    """Stand-in for ee.batch.Task backed by the fake task service"""
+
+    def __init__(self, fake, kind, config):
+        self._fake = fake
+        self.task_type = kind
+        self.config = config
+        self.id = None
+        self.graph_nodes = graph_size(config)
+
+    def start(self):
+        self.id = self._fake.tasks.start(self)
+        self._fake.task_starts += 1
+
+    def status(self):
+        self._fake.status_calls += 1
+        return {'id': self.id, 'state': self._fake.tasks.list_states().get(self.id, 'UNSUBMITTED')}
+
+    def active(self):
+        return self.status()['state'] in ('UNSUBMITTED', 'READY', 'RUNNING')
+
+
+class ExportNamespace:
+    """ee.batch.Export.<kind>.<destination>(...) returns a FakeTask"""
+
+    def __init__(self, fake, kind=None):
+        self._fake = fake
+        self._kind = kind
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._kind is None:
+            return ExportNamespace(self._fake, name)
+        return lambda **kwargs: FakeTask(self._fake, f'{self._kind}.{name}', kwargs)
+
+
+class FakeData:
+    """Stand-in for ee.data: task listing comes from the fake task service"""
+
+    def __init__(self, fake):
+        self._fake = fake
+
+    def getTaskList(self):
+        self._fake.list_calls += 1
+        errors = self._fake.tasks.errors
+        return [{'id': task_id, 'state': state, **({'error_message': errors[task_id]} if state == 'FAILED' else {})}
+                for task_id, state in self._fake.tasks.list_states().items()]
+
+
+class FakeEarthEngine:
+    """
+    Offline stand-in for the ee module. Operations build recorded expression graphs instead of
+    real ee objects, getInfo returns synthetic results (override per op name with `responses`),
+    and batch exports run on a FakeTaskBackend with configurable latency, failure rate and quota.
+    Counters (nodes_created, getinfo_calls, task_starts, list_calls, status_calls) measure RPCs.
+    """
+
+    EEException = real_ee.EEException
+
+    def __init__(self, latency=1.0, failure_rate=0.0, quota=None, responses=None, clock=None, seed=0,
+                 failure_message='Internal error.'):
+        self.clock = clock or SimulatedClock()
+        self.random = random.Random(seed)
+        duration = (lambda task: self.random.uniform(*latency)) if isinstance(latency, tuple) else latency
+        self.tasks = FakeTaskBackend(duration=duration, failure_rate=failure_rate, quota=quota,
+                                     clock=self.clock, seed=seed, failure_message=failure_message)
+        self.responses = responses or {}
+        self.batch = Namespace(self, 'batch')
+        self.batch.Export = ExportNamespace(self)
+        self.data = FakeData(self)
+        self.nodes_created = 0
+        self.getinfo_calls = 0
+        self.getinfo_ops = {}
+        self.task_starts = 0
+        self.list_calls = 0
+        self.status_calls = 0
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Namespace(self, name)
+
+    def Initialize(self, *args, **kwargs):
+        pass
+
+    def Authenticate(self, *args, **kwargs):
+        pass
+
+    def _trace(self, value):
+        """Record the body of Python callables passed to map() etc. by calling them on a placeholder"""
+        if callable(value) and not isinstance(value, (Node, Namespace)):
+            return value(Node(self, 'argument'))
+        return value
+
+    def _get_info(self, node):
+        self.getinfo_calls += 1
+        self.getinfo_ops[node._op] = self.getinfo_ops.get(node._op, 0) + 1
+        if node._op in self.responses:
+            response = self.responses[node._op]
+            return response(node) if callable(response) else response
+        if node._op in GEOMETRY_OPS:
+            return dict(SQUARE)
+        if node._op == 'size':
+            return 100
+        if node._op == 'bandNames':
+            return list(MODIS_BANDS)
+        if node._op in ('reduceRegion', 'Dictionary', 'toDictionary'):
+            return {}
+        if node._op in ('FeatureCollection', 'map', 'filter', 'flatten'):
+            return {'type': 'FeatureCollection', 'features': []}
+        return None
+
+
+def graph_size(value, seen=None):
+    """Number of distinct recorded nodes reachable from value (a Node, or containers of Nodes)"""
+    seen = set() if seen is None else seen
+    if isinstance(value, Node):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        return 1 + sum(graph_size(v, seen) for v in itertools.chain(value._args, value._kwargs.values()))
+    if isinstance(value, dict):
+        return sum(graph_size(v, seen) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(graph_size(v, seen) for v in value)
+    return 0
+
+
+@contextlib.contextmanager
+def fake_earth_engine(**options):
+    """
+    Swap the ee module for a FakeEarthEngine in every already-imported module of this package
+    (and for later `import ee`), restoring the real module on exit.
+
+        with fake_earth_engine(latency=(60, 300)) as fake:
+            task = analysis.build_analysis_task('916', 2010)
+            print(task.graph_nodes, fake.getinfo_calls)
+    """
+    fake = FakeEarthEngine(**options)
+    here = os.path.dirname(os.path.abspath(__file__))
+    patched = [module for module in list(sys.modules.values())
+               if getattr(module, 'ee', None) is real_ee
+               and os.path.dirname(os.path.abspath(getattr(module, '__file__', None) or '/')) == here]
+    for module in patched:
+        module.ee = fake
+    sys.modules['ee'] = fake
+    try:
+        yield fake
+    finally:
+        sys.modules['ee'] = real_ee
+        for module in patched:
+            module.ee = real_ee
+
+
+def simulate_run(wdpaids, years, max_concurrent=15, tick=5, latency=(60, 300), failure_rate=0.0,
+                 quota=None, build=None, seed=0):
+    """
+    Run the export scheduler over every (wdpaid, year) against the fake backend on a simulated clock.
+    Returns wall-clock (simulated) seconds, RPC counts and per-task graph sizes, so scheduler
+    throughput and graph size regressions can be measured offline.
+    """
+    import analysis
+
+    with fake_earth_engine(latency=latency, failure_rate=failure_rate, quota=quota, seed=seed) as fake, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        saved_cache_dir, analysis.AOI_CACHE_DIR = analysis.AOI_CACHE_DIR, cache_dir
+        build = build or (lambda key: analysis.build_analysis_task(*key))
+        per_task = []
+
+        def measured_build(key):
+            getinfo_before = fake.getinfo_calls
+            task = build(key)
+            per_task.append({'key': key, 'graph_nodes': task.graph_nodes,
+                             'getinfo_calls': fake.getinfo_calls - getinfo_before})
+            return task
+
+        try:
+            scheduler = ExportScheduler(EETaskBackend(), max_concurrent=max_concurrent, tick=tick,
+                                        sleep=fake.clock.sleep, verbose=False)
+            keys = [(w, y) for w in wdpaids for y in years]
+            results = scheduler.run(keys, measured_build)
+        finally:
+            analysis.AOI_CACHE_DIR = saved_cache_dir
+
+    total_export = sum(r['done_at'] for r in fake.tasks.tasks.values()) - \
+        sum(r['started_at'] for r in fake.tasks.tasks.values())
+    return {
+        'tasks': len(keys),
+        'failed': sum(1 for state in results.values() if state != 'COMPLETED'),
+        'simulated_seconds': fake.clock.now,
+        'ideal_seconds': total_export / max_concurrent,
+        'task_starts': fake.task_starts,
+        'list_calls': fake.list_calls,
+        'getinfo_calls': fake.getinfo_calls,
+        'mean_graph_nodes': sum(t['graph_nodes'] for t in per_task) / max(len(per_task), 1),
+        'per_task': per_task,
+    }
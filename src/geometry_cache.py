@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+import threading
+import ee
+
+
+class AOICache:
+    """
+    Persistent local cache of buffered, water-masked AOI geometries.
+    Entries are GeoJSON files keyed by (WDPA_PID, buffer_distance, max_error, water dataset),
+    and the least recently used files are evicted once the cache grows past max_bytes.
+    Safe to share across threads: concurrent misses on the same key compute the geometry once.
+    """
+
+    def __init__(self, cache_dir='aoi_cache', max_bytes=500 * 1024 ** 2, simplify_error=30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.simplify_error = simplify_error
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._server_side = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.geojson')
+
+    def get(self, key):
+        """Return the cached ee.Geometry for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                geojson = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(path)  # mark as recently used
+        return ee.Geometry(geojson['geometry'])
+
+    def put(self, key, geojson):
+        """Store a GeoJSON geometry dict under key and evict old entries if over budget"""
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'key': key, 'geometry': geojson}, f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.geojson'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass  # evicted concurrently
+            total -= size
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(json.dumps(key), threading.Lock())
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached geometry for key, or evaluate compute() -> ee.Geometry once,
+        simplify it, cache it locally and return it. Falls back to the server-side
+        geometry if it cannot be fetched (e.g. too large for getInfo); that fallback is
+        kept in memory so other threads do not retry the fetch.
+        Threads missing the same key wait for the first one instead of fetching it again.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        with self._lock(key):
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            if json.dumps(key) in self._server_side:
+                return self._server_side[json.dumps(key)]
+            geom = compute()
+            try:
+                geojson = geom.simplify(maxError=self.simplify_error).getInfo()
+            except ee.EEException as e:
+                print(f"AOI cache: could not fetch geometry for {key}, using server-side geometry: {e}")
+                self._server_side[json.dumps(key)] = geom
+                return geom
+            self.put(key, geojson)
+            return ee.Geometry(geojson)
@@ -0,0 +1,180 @@
+import sys
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from ee import batch, serializer
+from ee import data as ee_data
+from ee.computedobject import ComputedObject
+
+
+_labels = contextvars.ContextVar('ee_trace_labels', default={})
+
+
+@contextlib.contextmanager
+def trace(**labels):
+    """
+    Attach labels (e.g. wdpaid, year, stage) to every EE round-trip made inside the block.
+    Nested blocks add to the outer labels. Costs nothing when no EEProfiler is active.
+    """
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+GRAPH_NODE_KINDS = ('functionInvocationValue', 'functionDefinitionValue', 'argumentReference')
+
+
+def _expression_nodes(node, values, seen):
+    """Graph nodes in one encoded ValueNode, following valueReferences into values once each"""
+    if isinstance(node, list):
+        return sum(_expression_nodes(v, values, seen) for v in node)
+    if not isinstance(node, dict) or 'constantValue' in node:
+        return 0
+    if 'valueReference' in node:
+        ref = node['valueReference']
+        if ref in seen:
+            return 0
+        seen.add(ref)
+        return _expression_nodes(values[ref], values, seen)
+    if 'functionDefinitionValue' in node:
+        # The body of a function definition is the name of a value
+        return 1 + _expression_nodes({'valueReference': node['functionDefinitionValue']['body']}, values, seen)
+    own = sum(1 for kind in GRAPH_NODE_KINDS if kind in node)
+    return own + sum(_expression_nodes(v, values, seen) for v in node.values())
+
+
+def graph_node_count(value):
+    """
+    Number of nodes (function invocations and definitions, argument references) in the expression
+    graph(s) of a ComputedObject, or of those inside a dict/list, counting shared subgraphs once
+    """
+    if isinstance(value, ComputedObject):
+        try:
+            encoded = serializer.encode(value, for_cloud_api=True)
+        except Exception:
+            return None
+        return _expression_nodes({'valueReference': encoded['result']}, encoded['values'], set()) or 1
+    if isinstance(value, dict):
+        counts = [graph_node_count(v) for v in value.values()]
+    elif isinstance(value, (list, tuple)):
+        counts = [graph_node_count(v) for v in value]
+    else:
+        return 0
+    return sum(c for c in counts if c)
+
+
+def _payload_bytes(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+def _caller():
+    """file:line and function of the first frame outside this module and the ee package"""
+    frame = sys._getframe(2)
+    while frame and (frame.f_code.co_filename == __file__ or '/ee/' in frame.f_code.co_filename):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return f'{frame.f_code.co_filename.split("/")[-1]}:{frame.f_lineno} {frame.f_code.co_name}'
+
+
+class EEProfiler:
+    """
+    Records every getInfo, task start, task status and task listing call while active:
+    latency, response payload size, serialized graph node count, calling line and the
+    labels set with trace(). Use as a context manager, in scripts or notebooks:
+
+        with EEProfiler() as profiler:
+            pipeline.run_pipeline(geom)
+        profiler.summary()
+        profiler.to_json('ee_profile.jsonl')
+    """
+
+    def __init__(self, count_nodes=True):
+        self.count_nodes = count_nodes
+        self.records = []
+        self._lock = threading.Lock()
+        self._originals = {}
+
+    def _record(self, kind, latency, payload=None, graph=None, error=None):
+        record = {
+            'kind': kind,
+            **_labels.get(),
+            'latency_s': latency,
+            'response_bytes': _payload_bytes(payload) if error is None else None,
+            'graph_nodes': graph_node_count(graph) if self.count_nodes and graph is not None else None,
+            'caller': _caller(),
+            'error': error,
+            'timestamp': time.time(),
+        }
+        with self._lock:
+            self.records.append(record)
+
+    def _wrap(self, kind, func, graph_of=None):
+        profiler = self
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            graph = graph_of(*args) if graph_of else None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                profiler._record(kind, time.perf_counter() - start, graph=graph, error=str(e))
+                raise
+            profiler._record(kind, time.perf_counter() - start, payload=result, graph=graph)
+            return result
+        return wrapper
+
+    def __enter__(self):
+        targets = [
+            (ComputedObject, 'getInfo', 'getInfo', lambda obj: obj),
+            (batch.Task, 'start', 'task.start', lambda task: task.config),
+            (batch.Task, 'status', 'task.status', None),
+            (ee_data, 'getTaskList', 'task.list', None),
+        ]
+        for owner, name, kind, graph_of in targets:
+            original = getattr(owner, name)
+            self._originals[(owner, name)] = original
+            setattr(owner, name, self._wrap(kind, original, graph_of))
+        return self
+
+    def __exit__(self, *exc):
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+        self._originals.clear()
+        return False
+
+    def to_json(self, path):
+        """Write one JSON record per line"""
+        with open(path, 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + '\n')
+        return path
+
+    def dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+    def summary(self, by=('stage', 'kind')):
+        """Calls, total/mean latency, response bytes and graph nodes grouped by the given labels"""
+        df = self.dataframe()
+        if df.empty:
+            return df
+        by = [c for c in by if c in df.columns]
+        if not by:
+            by = ['kind']
+        df[by] = df[by].fillna('-')
+        return df.groupby(by).agg(
+            calls=('kind', 'size'),
+            total_s=('latency_s', 'sum'),
+            mean_s=('latency_s', 'mean'),
+            response_bytes=('response_bytes', 'sum'),
+            mean_graph_nodes=('graph_nodes', 'mean'),
+            errors=('error', 'count'),
+        ).sort_values('total_s', ascending=False)
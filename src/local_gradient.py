@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+from rasterio.windows import Window
+from rasterio.features import geometry_mask
+from biomes import local_donuts
+
+
+STAT_KEYS = ['x_mean', 'x_stdDev', 'x_count']
+
+
+class RunningStats:
+    """Mergeable count/mean/M2 accumulator (Chan et al. parallel variance)"""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        if values.size:
+            self.merge(RunningStats(values.size, values.mean(), ((values - values.mean()) ** 2).sum()))
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        return self
+
+    def result(self):
+        """mean, population stdDev and count, named like the EE reduceRegion output"""
+        if self.count == 0:
+            return {'x_mean': None, 'x_stdDev': None, 'x_count': 0}
+        return {'x_mean': float(self.mean), 'x_stdDev': float(np.sqrt(self.m2 / self.count)), 'x_count': int(self.count)}
+
+
+def meters_per_degree(lat):
+    """Meters per degree of longitude and of latitude at latitude lat (degrees) on the WGS84 ellipsoid"""
+    a, e2 = 6378137.0, 0.00669437999014
+    phi = np.radians(lat)
+    w = np.sqrt(1 - e2 * np.sin(phi) ** 2)
+    return np.pi / 180 * a * np.cos(phi) / w, np.pi / 180 * a * (1 - e2) / w ** 3
+
+
+def gradient_magnitude(data, res_x, res_y):
+    """
+    Gradient magnitude of a 2D array in value units per meter, NaN where a neighbour is missing.
+    res_x and res_y are pixel sizes in meters, scalars or one per row (shape (rows, 1)).
+    """
+    grad_y, grad_x = np.gradient(data)
+    return np.sqrt((grad_x / res_x) ** 2 + (grad_y / res_y) ** 2)
+
+
+def zone_geometries(pa_geometry, boundary_distance=1000, buffer_distance=10000, aoi=None):
+    """
+    Boundary (+/- boundary_distance) and buffer (+/- buffer_distance, or aoi) donuts around a PA.
+    Geometries are EPSG:4326 and distances meters; donuts are buffered with biomes.local_donuts.
+    """
+    distances = [boundary_distance] + ([buffer_distance] if aoi is None else [])
+    donuts = local_donuts([pa_geometry], distances)
+    boundary = donuts[boundary_distance][0]
+    buffer = aoi if aoi is not None else donuts[buffer_distance][0]
+    return {'boundary': boundary.intersection(buffer), 'buffer': buffer}
+
+
+def gradient_statistics(tif_path, pa_geometry, geometry_crs='EPSG:4326', band=1, is_gradient=True,
+                        boundary_distance=1000, buffer_distance=10000, aoi=None):
+    """
+    Local equivalent of FeatureProcessor.process_all_bands_ee for one band of an exported GeoTIFF.
+    The raster is read block by block (with a one pixel halo for the gradient), so whole rasters
+    are never loaded. By default the raster is a build_image_task export: the gradient magnitude
+    already clipped to the boundary zone, so only boundary statistics are returned. Pass
+    is_gradient=False for a raw band covering the buffer AOI to get boundary and buffer statistics.
+    pa_geometry (and optional aoi) are shapely geometries in geometry_crs. The raster may be
+    geographic (as ExportResults.image_task writes it; gradients are scaled by the meters per degree
+    of each row) or projected in meters; any other CRS raises ValueError.
+    Returns {'boundary_x_mean': ..., 'buffer_x_count': ..., ...}.
+    """
+    with rasterio.open(tif_path) as src:
+        if src.crs is None or not (src.crs.is_geographic or src.crs.linear_units_factor[1] == 1.0):
+            raise ValueError(f'{tif_path}: raster CRS {src.crs} is neither geographic nor projected in meters')
+        geoms = gpd.GeoSeries([pa_geometry] + ([aoi] if aoi is not None else []), crs=geometry_crs).to_crs('EPSG:4326')
+        zones = zone_geometries(geoms.iloc[0], boundary_distance, buffer_distance,
+                                geoms.iloc[1] if aoi is not None else None)
+        if is_gradient:
+            zones = {'boundary': zones['boundary']}
+        zones = dict(zip(zones, gpd.GeoSeries(list(zones.values()), crs='EPSG:4326').to_crs(src.crs)))
+        res_x, res_y = src.res
+        stats = {name: RunningStats() for name in zones}
+
+        for _, window in src.block_windows(band):
+            # Read with a halo so gradients at block edges match a whole-raster computation
+            row0, col0 = max(window.row_off - 1, 0), max(window.col_off - 1, 0)
+            row1 = min(window.row_off + window.height + 1, src.height)
+            col1 = min(window.col_off + window.width + 1, src.width)
+            padded = Window(col0, row0, col1 - col0, row1 - row0)
+            data = src.read(band, window=padded, masked=True).astype('float64').filled(np.nan)
+
+            if is_gradient:
+                values = data
+            elif src.crs.is_geographic:
+                lat = src.xy(np.arange(row0, row1), np.zeros(row1 - row0, dtype=int))[1]
+                mx, my = meters_per_degree(np.asarray(lat)[:, None])
+                values = gradient_magnitude(data, res_x * mx, res_y * my)
+            else:
+                values = gradient_magnitude(data, res_x, res_y)
+            r, c = window.row_off - row0, window.col_off - col0
+            values = values[r:r + window.height, c:c + window.width]
+
+            transform = src.window_transform(window)
+            valid = np.isfinite(values)
+            for name, geom in zones.items():
+                if geom.is_empty:
+                    continue
+                inside = geometry_mask([geom], out_shape=values.shape, transform=transform, invert=True)
+                stats[name].add(values[inside & valid])
+
+    return {f'{name}_{k}': v for name, s in stats.items() for k, v in s.result().items()}
+
+
+def compare_with_ee(local_stats, ee_row, rtol=0.05):
+    """
+    Parity check of local statistics against a row of an EE stats table (e.g. one exported CSV row).
+    Returns a DataFrame with the local and EE value, relative difference and pass flag per column.
+    """
+    rows = []
+    for key, local in local_stats.items():
+        remote = ee_row.get(key)
+        if local is None or remote is None or pd.isnull(remote):
+            rel = np.nan
+        else:
+            rel = abs(local - remote) / max(abs(remote), 1e-12)
+        rows.append({'stat': key, 'local': local, 'ee': remote, 'rel_diff': rel, 'ok': bool(rel <= rtol)})
+    return pd.DataFrame(rows)
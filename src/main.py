@@ -1,8 +1,8 @@
 import ee
 import time
-from analysis import run_all
-from utils import *
-from config import *
+from analysis import run_all, RunOptions
+from config import SELECTION_COLUMNS, filter_eligible
+from instrument import EEProfiler
 
 ee.Authenticate()
 ee.Initialize(project='dse-staff')
@@ -10,14 +10,19 @@ ee.Initialize(project='dse-staff')
 def main():
     start = time.time()
 
+    import geopandas as gpd
     shp_path = '/workspace/data/global_wdpa_June2021/Global_wdpa_wInfo_June2021.shp'
-    gdf = gpd.read_file(shp_path)
-    wdpaids = gdf['WDPA_PID'].head(50).tolist()
+    # Only the selection attributes of the first 50 rows are needed
+    attrs = gpd.read_file(shp_path, rows=50, columns=SELECTION_COLUMNS, ignore_geometry=True)
+    wdpaids = filter_eligible(attrs['WDPA_PID'].tolist(), attrs)
 
-    run_all(wdpaids, start_year=2001, n_years=23, max_concurrent=15)
+    with EEProfiler() as profiler:
+        run_all(wdpaids, start_year=2001, n_years=23, options=RunOptions(prefiltered=True), max_concurrent=15)
 
     end = time.time()
     print(f"Total elapsed time: {end - start:.2f} seconds")
+    print(profiler.summary())
+    profiler.to_json('ee_profile.jsonl')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os
+import re
+import time
+import sqlite3
+
+
+class RunManifest:
+    """
+    Durable SQLite record of every export task submitted by run_all.
+    One row per (wdpaid, year) holding the latest task id, state and output prefix,
+    so an interrupted run can be resumed without resubmitting finished work.
+    """
+
+    def __init__(self, path='run_manifest.sqlite'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                wdpaid TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                task_id TEXT,
+                state TEXT,
+                prefix TEXT,
+                updated REAL,
+                PRIMARY KEY (wdpaid, year)
+            )""")
+        self.conn.commit()
+
+    def record_submit(self, wdpaid, year, task_id, prefix):
+        """Record a freshly started task, replacing any earlier attempt for the same pair"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, 'READY', ?, ?)",
+            (str(wdpaid), int(year), task_id, prefix, time.time()))
+        self.conn.commit()
+
+    def update_state(self, wdpaid, year, state):
+        """Set the state of the latest task for (wdpaid, year)"""
+        self.conn.execute(
+            "UPDATE tasks SET state = ?, updated = ? WHERE wdpaid = ? AND year = ?",
+            (state, time.time(), str(wdpaid), int(year)))
+        self.conn.commit()
+
+    def entries(self):
+        """Return {(wdpaid, year): {'task_id', 'state', 'prefix'}} for every recorded pair"""
+        rows = self.conn.execute("SELECT wdpaid, year, task_id, state, prefix FROM tasks")
+        return {(w, y): {'task_id': t, 'state': s, 'prefix': p} for w, y, t, s, p in rows}
+
+    def with_state(self, *states):
+        """Return the set of (wdpaid, year) pairs whose latest task is in one of the given states"""
+        return {key for key, entry in self.entries().items() if entry['state'] in states}
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_table_name(name, extension='.csv'):
+    """
+    (wdpaid, year) pairs covered by a table file, from its path below the table prefix:
+    '<wdpaid>_<year>' for single tables and 'multi/<wdpaid>_<first>_<last>' for multi-year tables.
+    Multi-PA tables ('multi/<wdpaid>_<n>pa_<first>_<last>') do not name their PAs and yield nothing;
+    the manifest records those. Unrecognised names yield nothing.
+    """
+    ext = re.escape(extension)
+    match = re.fullmatch(r'multi/([^/]+?)_(\d{4})_(\d{4})' + ext, name)
+    if match:
+        wdpaid, first, last = match.group(1), int(match.group(2)), int(match.group(3))
+        if re.search(r'_\d+pa$', wdpaid):
+            return set()
+        return {(wdpaid, year) for year in range(first, last + 1)}
+    match = re.fullmatch(r'([^/]+)_(\d{4})' + ext, name)
+    if match:
+        return {(match.group(1), int(match.group(2)))}
+    return set()
+
+
+def list_exported_tables(bucket_name, prefix, extension='.csv'):
+    """Return the set of (wdpaid, year) pairs that already have a table file under gs://bucket_name/prefix"""
+    from google.cloud import storage
+    bucket = storage.Client().bucket(bucket_name)
+    exported = set()
+    for blob in bucket.list_blobs(prefix=prefix):
+        exported |= parse_table_name(blob.name[len(prefix):].lstrip('/'), extension)
+    return exported
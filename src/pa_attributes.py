@@ -0,0 +1,104 @@
+import os
+import copy
+import json
+import threading
+import ee
+from config import load_protected_area
+
+
+METADATA_FIELDS = ['WDPA_PID', 'ORIG_NAME', 'GOV_TYPE', 'OWN_TYPE', 'STATUS_YR', 'IUCN_CAT', 'GIS_AREA']
+MISSING_GHM = -9999
+
+
+class PAAttributeCache:
+    """
+    Persistent local cache of the time-invariant attributes of each protected area:
+    WDPA metadata, mean gHM and BIOME_NAME over its AOI, stored in a JSON file.
+    gHM and biome depend on how the AOI was built, so entries are keyed by geo_ops.aoi_key
+    (WDPA_PID, buffer, water mode or dataset, local donut tolerance): values computed under
+    another water mode or donut store are never reused.
+    fill() fetches every missing PA with one reduceRegions and getInfo per chunk, so the
+    per-year export graphs can carry these values as constants.
+    """
+
+    def __init__(self, path='pa_attributes.json', geo_ops=None):
+        self.path = path
+        self.geo_ops = geo_ops
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.attributes = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.attributes = {}
+
+    def key(self, wdpaid):
+        """Entry key of wdpaid under geo_ops"""
+        return json.dumps(self.geo_ops.aoi_key(wdpaid) if self.geo_ops is not None else [str(wdpaid)])
+
+    def __contains__(self, wdpaid):
+        return self.key(wdpaid) in self.attributes
+
+    def get(self, wdpaid):
+        """Return the cached attribute dict for wdpaid, or None"""
+        return self.attributes.get(self.key(wdpaid))
+
+    def missing(self, wdpaids):
+        """wdpaids without cached attributes, in order and without duplicates"""
+        return [w for w in dict.fromkeys(str(w) for w in wdpaids) if w not in self]
+
+    def update(self, attributes):
+        """Add {WDPA_PID: {...}} entries and write the cache file"""
+        with self._lock:
+            self.attributes.update({self.key(k): v for k, v in attributes.items()})
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.attributes, f)
+            os.replace(tmp, self.path)
+
+    def fill(self, wdpaids, stats_ops, biome_lookup=None, prefiltered=False, chunk_size=200):
+        """
+        Fetch and store attributes of the wdpaids not cached yet.
+        gHM and (unless in biome_lookup) biome are computed over geo_ops.masked_aoi, the same AOI the
+        export tasks use, built without the AOI cache so it stays in the chunk's one server-side graph
+        instead of costing a getInfo per PA. A chunk that fails (e.g. an unknown WDPA_PID or a vectorization timeout) is
+        skipped, and its PAs compute their attributes inside their own tasks.
+        Returns the number of protected areas stored.
+        """
+        geo_ops = copy.copy(self.geo_ops)
+        geo_ops.aoi_cache = None
+        biome_lookup = biome_lookup or {}
+        todo = self.missing(wdpaids)
+        stored = 0
+        for i in range(0, len(todo), chunk_size):
+            chunk = todo[i:i + chunk_size]
+            features = []
+            for wdpaid in chunk:
+                pa = load_protected_area(wdpaid, prefiltered)
+                aoi = geo_ops.masked_aoi(wdpaid, pa.geometry())
+                biome = biome_lookup.get(wdpaid) or geo_ops.get_biome(aoi)
+                features.append(ee.Feature(aoi, pa.toDictionary(METADATA_FIELDS))
+                                .set('WDPA_PID', wdpaid, 'BIOME_NAME', biome))
+
+            reduced = geo_ops.mask_image(stats_ops.gHM_mean).reduceRegions(
+                collection=ee.FeatureCollection(features),
+                reducer=ee.Reducer.mean().setOutputs(['gHM']),
+                scale=500
+            )
+            # Drop geometries so only the attributes come back
+            result = reduced.map(lambda f: ee.Feature(None, f.toDictionary()))
+
+            try:
+                features = result.getInfo()['features']
+            except ee.EEException as e:
+                print(f"PA attributes: chunk of {len(chunk)} PAs starting at {chunk[0]} failed, "
+                      f"computing their attributes in-task: {e}")
+                continue
+            fetched = {}
+            for feature in features:
+                props = feature['properties']
+                if props.get('gHM') is None:
+                    props['gHM'] = MISSING_GHM
+                fetched[str(props['WDPA_PID'])] = props
+            self.update(fetched)
+            stored += len(fetched)
+        return stored
@@ -0,0 +1,250 @@
+import ee
+import time
+import random
+import threading
+import concurrent.futures
+from instrument import trace
+
+
+ACTIVE_STATES = {'UNSUBMITTED', 'READY', 'RUNNING', 'CANCEL_REQUESTED'}
+TERMINAL_STATES = {'COMPLETED', 'FAILED', 'CANCELLED'}
+RATE_LIMIT_MARKERS = ('too many', 'quota', 'rate limit', 'rate-limit', '429', 'resource_exhausted')
+MEMORY_ERROR_MARKERS = ('memory limit', 'out of memory', 'too many pixels', 'timed out')
+
+
+def is_rate_limit_error(exc):
+    """Return True if an exception looks like a quota or rate-limit rejection"""
+    message = str(exc).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def is_memory_error(message):
+    """Return True if a task error message says the computation was too big (memory, pixels or time)"""
+    message = str(message or '').lower()
+    return any(marker in message for marker in MEMORY_ERROR_MARKERS)
+
+
+class EETaskBackend:
+    """Task backend that talks to the Earth Engine batch API. errors holds {task_id: error_message} of failed tasks."""
+
+    def __init__(self):
+        self.errors = {}
+
+    def start(self, task):
+        """Start an unstarted ee.batch.Task and return its id"""
+        task.start()
+        return task.id
+
+    def list_states(self):
+        """Return {task_id: state} for all recent tasks in one listing call"""
+        tasks = ee.data.getTaskList()
+        self.errors.update({t['id']: t['error_message'] for t in tasks if t.get('error_message')})
+        return {t['id']: t['state'] for t in tasks}
+
+
+class FakeTaskBackend:
+    """
+    Local stand-in for the EE task service.
+    Each started task runs for `duration` seconds (or duration(task) if callable) and ends in COMPLETED,
+    or FAILED with probability `failure_rate` (or failure_rate(task) if callable) and error
+    `failure_message`. `quota` caps how many tasks may be active at once; starting beyond it raises
+    a 'Too many tasks' error like the real service.
+    """
+
+    def __init__(self, duration=1.0, failure_rate=0.0, quota=None, clock=time.monotonic, seed=None,
+                 failure_message='Internal error.'):
+        self.duration = duration
+        self.failure_rate = failure_rate
+        self.quota = quota
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.failure_message = failure_message
+        self.tasks = {}
+        self.errors = {}
+        self.start_calls = 0
+        self.list_calls = 0
+        self._lock = threading.Lock()
+
+    def _state(self, record):
+        if self.clock() < record['done_at']:
+            return 'RUNNING'
+        return record['final_state']
+
+    def start(self, task):
+        with self._lock:
+            self.start_calls += 1
+            active = sum(1 for r in self.tasks.values() if self._state(r) == 'RUNNING')
+            if self.quota is not None and active >= self.quota:
+                raise ee.EEException('Too many tasks already in the queue')
+            duration = self.duration(task) if callable(self.duration) else self.duration
+            failure_rate = self.failure_rate(task) if callable(self.failure_rate) else self.failure_rate
+            task_id = f'FAKE{len(self.tasks):06d}'
+            self.tasks[task_id] = {
+                'task': task,
+                'started_at': self.clock(),
+                'done_at': self.clock() + duration,
+                'final_state': 'FAILED' if self.random.random() < failure_rate else 'COMPLETED',
+            }
+            if self.tasks[task_id]['final_state'] == 'FAILED':
+                self.errors[task_id] = self.failure_message
+            return task_id
+
+    def list_states(self):
+        with self._lock:
+            self.list_calls += 1
+            return {task_id: self._state(r) for task_id, r in self.tasks.items()}
+
+
+class ExportScheduler:
+    """
+    Keeps up to max_concurrent export tasks in flight. Tasks are built and started by a pool of
+    max_workers threads, each taking one of max_concurrent slots (a semaphore) just before starting;
+    slots are released when the task reaches a final state. Task status comes from one bulk listing
+    call per tick. Quota/rate-limit errors on start trigger an exponential backoff that relaxes again
+    after successful starts; any other build or start error is retried up to max_retries times with
+    jittered exponential delays.
+    Every key gets a record in self.results: key, task_id, state, attempts, error and submit_s
+    (seconds spent building and starting). verbose=True also prints progress every tick.
+    """
+
+    def __init__(self, backend=None, max_concurrent=12, tick=5, min_backoff=5, max_backoff=600,
+                 sleep=time.sleep, verbose=False, max_workers=8, max_retries=3, seed=None):
+        self.backend = backend or EETaskBackend()
+        self.max_concurrent = max_concurrent
+        self.tick = tick
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+        self.verbose = verbose
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.random = random.Random(seed)
+        self.backoff = 0
+        self.results = []
+        self._lock = threading.Lock()
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _jitter(self, seconds):
+        return seconds * self.random.uniform(0.5, 1.5)
+
+    def _start(self, key, task):
+        """Start one task. Returns task id, or None if the service asked us to back off."""
+        try:
+            with trace(stage='start', key=str(key)):
+                task_id = self.backend.start(task)
+        except Exception as exc:
+            if not is_rate_limit_error(exc):
+                raise
+            with self._lock:
+                self.backoff = min(max(self.backoff * 2, self.min_backoff), self.max_backoff)
+                backoff = self.backoff
+            self._log(f"Rate limited starting {key}, backing off {backoff:.0f}s: {exc}")
+            return None
+        with self._lock:
+            self.backoff = self.backoff / 2 if self.backoff > self.min_backoff else 0
+        return task_id
+
+    def _submit(self, key, build, slots):
+        """
+        Worker: build the task, wait for a free slot and start it, retrying errors.
+        Returns a result record; 'state' is 'SUBMITTED' on success or 'SUBMIT_FAILED'.
+        """
+        record = {'key': key, 'task_id': None, 'state': 'SUBMIT_FAILED', 'attempts': 0, 'error': None}
+        began = time.perf_counter()
+        task = None
+        while True:
+            record['attempts'] += 1
+            try:
+                # Keep the built task so a failed or rate-limited start does not rebuild its graph
+                if task is None:
+                    task = build(key)
+                slots.acquire()
+                task_id = self._start(key, task)
+                if task_id is not None:
+                    record.update(task_id=task_id, state='SUBMITTED', error=None)
+                    break
+                slots.release()
+                self.sleep(self._jitter(self.backoff or self.min_backoff))
+                record['attempts'] -= 1  # rate limiting does not use up retries
+            except Exception as exc:
+                if task is not None:
+                    slots.release()
+                record['error'] = f'{type(exc).__name__}: {exc}'
+                if record['attempts'] > self.max_retries:
+                    self._log(f"Giving up on {key} after {record['attempts']} attempts: {exc}")
+                    break
+                self.sleep(self._jitter(self.min_backoff * 2 ** (record['attempts'] - 1)))
+        record['submit_s'] = time.perf_counter() - began
+        return record
+
+    def run(self, keys, build, on_submit=None, on_finish=None, running=None):
+        """
+        Run build(key) -> unstarted task for every key and wait for all tasks to finish.
+        on_submit(key, task_id) and on_finish(key, task_id, state) are called as tasks move,
+        always from the calling thread.
+        running={task_id: key} adopts tasks already in flight from an earlier run.
+        Returns {key: final_state}; keys that could not be submitted get 'SUBMIT_FAILED'.
+        """
+        slots = threading.Semaphore(self.max_concurrent)
+        in_flight = {}
+        # Adopted tasks take slots too, as far as there are slots to take
+        for task_id, key in (running or {}).items():
+            in_flight[task_id] = (key, {'key': key, 'task_id': task_id, 'state': 'SUBMITTED',
+                                        'attempts': 0, 'error': None, 'submit_s': 0.0},
+                                  slots.acquire(blocking=False))
+        results = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            submitting = {executor.submit(self._submit, key, build, slots) for key in keys}
+
+            while submitting or in_flight:
+                # Collect finished submissions. While slots are free, briefly wait for workers
+                # to take them, so their start is seen before the next tick.
+                if in_flight:
+                    holding = sum(1 for _, _, holds_slot in in_flight.values() if holds_slot)
+                    free = submitting and holding < self.max_concurrent
+                    done, _ = concurrent.futures.wait(submitting, timeout=0.05 if free else 0,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                else:
+                    done, _ = concurrent.futures.wait(submitting, timeout=self.tick,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    submitting.discard(future)
+                    record = future.result()
+                    if record['state'] == 'SUBMIT_FAILED':
+                        results[record['key']] = record['state']
+                        self.results.append(record)
+                        continue
+                    in_flight[record['task_id']] = (record['key'], record, True)
+                    if on_submit:
+                        on_submit(record['key'], record['task_id'])
+
+                if not in_flight:
+                    continue
+                self.sleep(self.tick)
+
+                # One listing call for every in-flight task
+                with trace(stage='status'):
+                    states = self.backend.list_states()
+                for task_id in list(in_flight):
+                    state = states.get(task_id)
+                    if state is None or state in ACTIVE_STATES:
+                        continue
+                    key, record, holds_slot = in_flight.pop(task_id)
+                    if holds_slot:
+                        slots.release()
+                    record['state'] = results[key] = state
+                    if state != 'COMPLETED':
+                        record['error'] = getattr(self.backend, 'errors', {}).get(task_id)
+                    self.results.append(record)
+                    if on_finish:
+                        on_finish(key, task_id, state)
+                    if state != 'COMPLETED':
+                        self._log(f"Task {task_id} for {key} ended with state {state}")
+
+                self._log(f"{len(results)} done, {len(in_flight)} running, {len(submitting)} queued")
+
+        return results
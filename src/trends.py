@@ -0,0 +1,97 @@
+import time
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def group_trends(df, group_cols, x='year', y='edge_index'):
+    """
+    OLS trend of y on x for every group at once, using closed-form segmented sums.
+    Rows with a missing x or y are dropped; groups with fewer than two distinct x values get NaN,
+    and groups with exactly two points get an estimate but NaN std_err/t/p.
+    Returns one row per group with estimate, std_err, t_value, p_value, r_squared and n,
+    matching the per-group statsmodels OLS fits in notebooks/visualization.ipynb.
+    """
+    group_cols = list(group_cols)
+    data = df[group_cols + [x, y]].copy()
+    data[x] = pd.to_numeric(data[x], errors='coerce')
+    data[y] = pd.to_numeric(data[y], errors='coerce')
+    data = data.dropna(subset=[x, y])
+
+    codes, groups = pd.MultiIndex.from_frame(data[group_cols]).factorize()
+    n_groups = len(groups)
+    xs = data[x].to_numpy(dtype='float64')
+    ys = data[y].to_numpy(dtype='float64')
+
+    # Two passes: group means, then centered sums (avoids cancellation for values like years)
+    n = np.bincount(codes, minlength=n_groups).astype('float64')
+    x_mean = np.bincount(codes, xs, n_groups) / n
+    y_mean = np.bincount(codes, ys, n_groups) / n
+    dx = xs - x_mean[codes]
+    dy = ys - y_mean[codes]
+    sxx = np.bincount(codes, dx * dx, n_groups)
+    sxy = np.bincount(codes, dx * dy, n_groups)
+    syy = np.bincount(codes, dy * dy, n_groups)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        has_slope = sxx > 0
+        estimate = np.where(has_slope, sxy / sxx, np.nan)
+        resid_ss = np.clip(syy - estimate * sxy, 0, None)
+        dof = n - 2
+        std_err = np.where(has_slope & (dof > 0), np.sqrt(resid_ss / dof / sxx), np.nan)
+        t_value = estimate / std_err
+        p_value = 2 * stats.t.sf(np.abs(t_value), np.where(dof > 0, dof, np.nan))
+        r_squared = np.where(has_slope & (syy > 0), 1 - resid_ss / syy, np.nan)
+
+    result = pd.DataFrame(groups.tolist(), columns=group_cols)
+    result['estimate'] = estimate
+    result['std_err'] = std_err
+    result['t_value'] = t_value
+    result['p_value'] = p_value
+    result['r_squared'] = r_squared
+    result['n'] = n.astype(int)
+    return result
+
+
+def regression_table(df, biome_col='BIOME', x='year', y='edge_index'):
+    """
+    Global and per-biome trend for every band, in the layout of notebooks/regression_results.csv
+    (band_name, group, slope, p_value, r_squared, n).
+    """
+    global_fit = group_trends(df, ['band_name'], x, y).assign(group='Global')
+    biome_fit = group_trends(df, ['band_name', biome_col], x, y).rename(columns={biome_col: 'group'})
+    table = pd.concat([global_fit, biome_fit], ignore_index=True)
+    table = table.rename(columns={'estimate': 'slope'})
+    table['order'] = (table['group'] != 'Global').astype(int)
+    table = table.sort_values(['band_name', 'order'], kind='stable').drop(columns='order')
+    return table[['band_name', 'group', 'slope', 'p_value', 'r_squared', 'n']].reset_index(drop=True)
+
+
+def benchmark_against_statsmodels(df, group_cols=('WDPA_PID', 'band_name'), x='year', y='edge_index'):
+    """
+    Time group_trends against one statsmodels OLS per group and report the largest differences.
+    Returns a dict with both timings, the speedup and max absolute difference per statistic.
+    """
+    import statsmodels.api as sm
+
+    start = time.perf_counter()
+    fast = group_trends(df, group_cols, x, y)
+    fast_time = time.perf_counter() - start
+
+    def fit(group):
+        group = group.dropna(subset=[x, y])
+        if group[x].nunique() < 2:
+            return pd.Series({'estimate': np.nan, 'std_err': np.nan, 't_value': np.nan, 'p_value': np.nan})
+        model = sm.OLS(group[y].astype(float), sm.add_constant(group[x].astype(float))).fit()
+        return pd.Series({'estimate': model.params[x], 'std_err': model.bse[x],
+                          't_value': model.tvalues[x], 'p_value': model.pvalues[x]})
+
+    start = time.perf_counter()
+    slow = df.groupby(list(group_cols))[[x, y]].apply(fit).reset_index()
+    slow_time = time.perf_counter() - start
+
+    merged = fast.merge(slow, on=list(group_cols), suffixes=('', '_sm'))
+    max_diff = {col: float(np.nanmax(np.abs(merged[col] - merged[f'{col}_sm']), initial=0))
+                for col in ['estimate', 'std_err', 't_value', 'p_value']}
+    return {'groups': len(fast), 'vectorized_s': fast_time, 'statsmodels_s': slow_time,
+            'speedup': slow_time / fast_time, 'max_abs_diff': max_diff}
@@ -0,0 +1,135 @@
+import os
+import concurrent.futures
+from collections import deque
+import numpy as np
+
+# geemap, matplotlib, tifffile and IPython are imported inside the methods that use them,
+# so importing this module stays cheap for headless workers.
+
+
+class Visualization:
+    def __init__(self): 
+        self.default_vis_params = {
+            'min': 0,
+            'max': 0.0004,
+            'palette': ['black', 'white']
+        }
+
+    def create_map(self, geometry, gradient, boundary_pixels, vis_params=None):
+        """Create and return an interactive map"""
+        import geemap
+        if vis_params is None:
+            vis_params = self.default_vis_params
+        Map = geemap.Map()
+        Map.add_basemap('HYBRID')
+        Map.centerObject(geometry, 8)
+        Map.addLayer(geometry, {'color': 'red'}, 'Protected Area Geometry')
+        Map.addLayer(gradient, vis_params, 'Gradient Layer')
+        Map.addLayer(boundary_pixels, vis_params, 'Gradient Boundary Pixels')
+        return Map
+
+    def plot_edge_index(self, df):
+        """
+        Plot edge_index by year for each WDPA and band.
+        Line color = WDPA_PID, line style = band_name.
+        """
+        import matplotlib.pyplot as plt
+        line_styles = ['-', '--', '-.', ':']
+        bands = df[df['band_name'].isin(['BSI', 'NDVI'])]['band_name'].unique() #df['band_name'].unique()
+        style_map = {band: line_styles[i % len(line_styles)] for i, band in enumerate(bands)}
+
+        colors = plt.cm.tab10.colors  # Up to 10 distinct colors
+        wdpaids = df['ORIG_NAME'].unique()
+        color_map = {wdpa: colors[i % len(colors)] for i, wdpa in enumerate(wdpaids)}
+
+        plt.figure(figsize=(10, 6))
+        for band in bands:
+            for wdpa in wdpaids:
+                sub = df[(df['band_name'] == band) & (df['ORIG_NAME'] == wdpa)]
+                if not sub.empty:
+                    plt.plot(
+                        sub['year'],
+                        sub['edge_index'],
+                        marker='o',
+                        linestyle=style_map[band],
+                        color=color_map[wdpa],
+                        label=f'{wdpa}, Band {band}'
+                    )
+        plt.xlabel('Year')
+        plt.ylabel('Edge Index')
+        plt.legend()
+        plt.tight_layout()
+        plt.show()
+
+    def _magma_palette(self):
+        """Flat 256-colour GIF palette: magma for indices 0-254, white for no-data (255)"""
+        from matplotlib import colormaps
+        lut = (colormaps['magma'](np.linspace(0, 1, 255))[:, :3] * 255).astype(np.uint8)
+        return np.vstack([lut, [[255, 255, 255]]]).ravel().tolist()
+
+    def _render_frame(self, data, year, vmin, vmax, palette, canvas_shape, upscale):
+        """Map a 2D array onto the palette indices, draw the year label and return a 'P' mode frame"""
+        from PIL import Image as PILImage, ImageDraw, ImageFont
+        if data.ndim > 2:
+            data = data[0]
+        scaled = (data.astype(np.float32) - vmin) * (254.0 / (vmax - vmin))
+        index = np.where(np.isfinite(scaled), np.clip(scaled, 0, 254), 255).astype(np.uint8)
+
+        # Pad/crop onto a common canvas so every frame matches the GIF screen size
+        canvas = np.full(canvas_shape, 255, dtype=np.uint8)
+        h, w = min(index.shape[0], canvas_shape[0]), min(index.shape[1], canvas_shape[1])
+        canvas[:h, :w] = index[:h, :w]
+        if upscale > 1:
+            canvas = canvas.repeat(upscale, axis=0).repeat(upscale, axis=1)
+
+        frame = PILImage.fromarray(canvas, mode='P')
+        frame.putpalette(palette)
+        font_size = max(12, canvas.shape[0] // 25)
+        ImageDraw.Draw(frame).text((canvas.shape[1] * 0.05, canvas.shape[0] * 0.05), year, fill=0,
+                                   font=ImageFont.load_default(size=font_size),
+                                   stroke_width=1, stroke_fill=0)
+        return frame
+
+    def create_gif_from_tifs(self, folder, vmin=0, vmax=0.0004, frame_size=1000, duration=250, max_workers=4):
+        """
+        Build an animated GIF from the yearly TIFFs in folder.
+        Values are mapped straight onto a magma palette, so frames are written as indexed images
+        one at a time with no figure rendering or quantization, and TIFFs are decoded ahead of the
+        encoder on a thread pool. Only a small window of decoded rasters is held in memory.
+        """
+        import tifffile
+        from PIL import GifImagePlugin
+        from IPython.display import Image, display
+        tif_files = sorted([os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.tif')])
+        if not tif_files:
+            raise ValueError(f"No .tif files found in {folder}")
+
+        palette = self._magma_palette()
+        name =  os.path.basename(folder).split('/')[-1]
+        gif_path = f"/workspace/output/gifs/{name}.gif"
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor, open(gif_path, 'wb') as fp:
+            pending = deque(executor.submit(tifffile.imread, p) for p in tif_files[:max_workers * 2])
+            next_file = len(pending)
+            canvas_shape = upscale = None
+
+            for tif_path in tif_files:
+                data = pending.popleft().result()
+                if next_file < len(tif_files):
+                    pending.append(executor.submit(tifffile.imread, tif_files[next_file]))
+                    next_file += 1
+
+                # Extract year from filename (adjust if your pattern is different)
+                year = os.path.basename(tif_path).split('_')[-1].split('.')[0]
+                if canvas_shape is None:
+                    canvas_shape = data.shape[-2:]
+                    upscale = max(1, frame_size // max(canvas_shape))
+                frame = self._render_frame(data, year, vmin, vmax, palette, canvas_shape, upscale)
+
+                if fp.tell() == 0:
+                    header, _ = GifImagePlugin.getheader(frame, info={'loop': 0, 'optimize': False})
+                    fp.write(b''.join(header))
+                fp.write(b''.join(GifImagePlugin.getdata(frame, duration=duration)))
+            fp.write(b';')
+
+        return display(Image(filename=gif_path))
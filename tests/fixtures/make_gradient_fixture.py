@@ -0,0 +1,79 @@
+"""
+Writes gradient_4326.tif and gradient_expected.csv, the fixture of tests/test_local_gradient.py.
+
+The raster has the shape of what analysis.build_image_task exports: the gradient magnitude of one
+band, EPSG:4326, about 500 m pixels, tiled, clipped to 1 km either side of the PA boundary, with
+nodata elsewhere. The band is a plane rising 0.001 per meter northward and 0.002 per meter eastward
+around a 0.4 x 0.2 degree PA at 60N, so the magnitude is sqrt(0.001^2 + 0.002^2) everywhere.
+The expected row is analytic, not an EE export: it uses the boundary columns of the EE stats table,
+with the count as the zone area (2 * distance * perimeter + (pi - 4) * distance^2) divided by the
+pixel area at the PA's centre latitude. plane() is also used by the tests for raw-band rasters.
+"""
+import os
+import csv
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PA_BOUNDS = (10.0, 60.0, 10.4, 60.2)
+RES = 0.0045
+WEST, NORTH, WIDTH, HEIGHT = 9.7, 60.35, 222, 111
+GRADIENT = (0.002, 0.001)
+BOUNDARY = 1000
+NODATA = -9999.0
+
+
+def meters_per_degree(lat):
+    a, e2 = 6378137.0, 0.00669437999014
+    phi = np.radians(lat)
+    w = np.sqrt(1 - e2 * np.sin(phi) ** 2)
+    return np.pi / 180 * a * np.cos(phi) / w, np.pi / 180 * a * (1 - e2) / w ** 3
+
+
+def plane():
+    """Band values and the east/north position (m) from the PA centre of every pixel"""
+    lon0, lat0 = (PA_BOUNDS[0] + PA_BOUNDS[2]) / 2, (PA_BOUNDS[1] + PA_BOUNDS[3]) / 2
+    lon = WEST + (np.arange(WIDTH) + 0.5) * RES
+    lat = NORTH - (np.arange(HEIGHT) + 0.5) * RES
+    mx, my = meters_per_degree(lat)
+    east = (lon[None, :] - lon0) * mx[:, None]
+    north = np.broadcast_to(((lat - lat0) * meters_per_degree((lat + lat0) / 2)[1])[:, None], east.shape)
+    return (GRADIENT[0] * east + GRADIENT[1] * north).astype('float32'), east, north
+
+
+def write(path, data, nodata=None):
+    with rasterio.open(path, 'w', driver='GTiff', width=WIDTH, height=HEIGHT, count=1, dtype='float32',
+                       crs='EPSG:4326', transform=from_origin(WEST, NORTH, RES, RES), nodata=nodata,
+                       tiled=True, blockxsize=64, blockysize=64, compress='deflate', predictor=3) as dst:
+        dst.write(data, 1)
+
+
+def main():
+    _, east, north = plane()
+    lat = NORTH - (np.arange(HEIGHT) + 0.5) * RES
+    lat0 = (PA_BOUNDS[1] + PA_BOUNDS[3]) / 2
+    # Distance (m) of every pixel centre to the PA boundary, the PA's half sizes in the same metric frame
+    half_x = (PA_BOUNDS[2] - PA_BOUNDS[0]) / 2 * meters_per_degree(lat)[0][:, None]
+    half_y = (PA_BOUNDS[3] - lat0) * meters_per_degree(lat0)[1]
+    dx, dy = np.abs(east) - half_x, np.abs(north) - half_y
+    outside = np.hypot(np.maximum(dx, 0), np.maximum(dy, 0))
+    distance = np.where((dx > 0) | (dy > 0), outside, np.minimum(-dx, -dy))
+
+    magnitude = float(np.hypot(*GRADIENT))
+    data = np.where(distance <= BOUNDARY, magnitude, NODATA).astype('float32')
+    write(os.path.join(HERE, 'gradient_4326.tif'), data, NODATA)
+
+    cx, cy = meters_per_degree(lat0)
+    perimeter = 2 * (PA_BOUNDS[2] - PA_BOUNDS[0]) * cx + 2 * (PA_BOUNDS[3] - PA_BOUNDS[1]) * cy
+    area = 2 * BOUNDARY * perimeter + (np.pi - 4) * BOUNDARY ** 2
+    row = {'WDPA_PID': 'fixture', 'year': 2010, 'band_name': 'NDVI', 'boundary_x_mean': magnitude,
+           'boundary_x_stdDev': 0.0, 'boundary_x_count': round(area / (RES * cx * RES * cy))}
+    with open(os.path.join(HERE, 'gradient_expected.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(row))
+        writer.writeheader()
+        writer.writerow(row)
+
+
+if __name__ == '__main__':
+    main()
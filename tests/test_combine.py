@@ -0,0 +1,41 @@
+import os
+import pandas as pd
+from combine import CsvCombiner, LocalBucket
+
+HEADER = 'WDPA_PID,ORIG_NAME,year,band_name,STATUS_YR,gHM,boundary_x_mean,system:index\n'
+
+
+def write(root, name, rows):
+    path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(HEADER + ''.join(rows))
+
+
+def test_mixed_id_types_read_back_as_strings(tmp_path):
+    bucket, out = tmp_path / 'bucket', tmp_path / 'combined'
+    write(bucket, 'tables/916.csv', ['916,NA,2001,B4,1990,0.2,1.5,0\n', '916,NA,2002,B4,,,2.5,1\n'])
+    write(bucket, 'tables/555_A.csv', ['555_A,Reserve,2001,B4,2004,0.4,3.5,0\n'])
+    combiner = CsvCombiner(LocalBucket(str(bucket)), str(out), max_workers=2)
+    assert combiner.run('tables/') == 2
+
+    df = combiner.read()
+    assert sorted(df['WDPA_PID']) == ['555_A', '916', '916']
+    assert set(df['ORIG_NAME']) == {'NA', 'Reserve'}
+    assert df['STATUS_YR'].isna().sum() == 1 and df['boundary_x_mean'].sum() == 7.5
+    assert combiner.run('tables/') == 0
+
+
+def test_changed_blob_replaces_its_rows(tmp_path):
+    bucket, out = tmp_path / 'bucket', tmp_path / 'combined'
+    write(bucket, 'tables/916.csv', ['916,A,2001,B4,1990,0.2,1.5,0\n'])
+    combiner = CsvCombiner(LocalBucket(str(bucket)), str(out), max_workers=1)
+    combiner.run('tables/')
+    old_files = combiner.ingested['tables/916.csv']['files']
+
+    write(bucket, 'tables/916.csv', ['916,A,2001,B4,1990,0.2,9.5,0\n'])
+    os.utime(bucket / 'tables/916.csv', ns=(1, 1))
+    combiner = CsvCombiner(LocalBucket(str(bucket)), str(out), max_workers=1)
+    assert combiner.run('tables/') == 1
+    assert not any((out / f).exists() for f in old_files)
+    assert list(pd.read_parquet(out)['boundary_x_mean']) == [9.5]
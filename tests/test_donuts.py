@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import geopandas as gpd
+from pyproj import Geod
+from shapely.geometry import box, shape
+from donuts import build_donut_store, DonutStore
+
+GEOD = Geod(ellps='WGS84')
+
+
+def distances_to(pa, points):
+    """Geodesic distance (m) from each (lon, lat) point to the densified boundary of pa"""
+    lon, lat = np.array(pa.boundary.segmentize(0.0005).coords).T
+    return np.array([GEOD.inv(np.full(lon.size, x), np.full(lat.size, y), lon, lat)[2].min() for x, y in points])
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    pas = gpd.GeoDataFrame({'WDPA_PID': ['equator', 'north']},
+                           geometry=[box(10, 0, 10.3, 0.2), box(10, 60, 10.6, 60.2)], crs='EPSG:4326')
+    path = tmp_path_factory.mktemp('donuts') / 'donuts.parquet'
+    build_donut_store(pas, path, tolerance=100, max_workers=1)
+    return pas.set_index('WDPA_PID').geometry, path
+
+
+@pytest.mark.parametrize('pid', ['equator', 'north'])
+@pytest.mark.parametrize('distance', [10000, 1000])
+def test_rings_are_true_distances(store, pid, distance):
+    pas, path = store
+    donut = shape(DonutStore(path).geojson[(pid, distance)])
+    for ring in [donut.exterior, *donut.interiors]:
+        measured = distances_to(pas[pid], np.array(ring.coords)[::3])
+        assert np.all(np.abs(measured - distance) <= 100)
+
+
+def test_store_reads_requested_pas(store):
+    _, path = store
+    donuts = DonutStore(path, ['north'])
+    assert ('north', 1000) in donuts and ('equator', 1000) not in donuts
+    assert donuts.tolerance == 100
@@ -0,0 +1,35 @@
+import time
+import concurrent.futures
+from fake_ee import fake_earth_engine
+from geometry_cache import AOICache
+
+
+def test_concurrent_misses_compute_once(tmp_path):
+    with fake_earth_engine() as fake:
+        cache = AOICache(str(tmp_path))
+        computed = []
+
+        def compute():
+            computed.append(1)
+            time.sleep(0.05)
+            return fake.Geometry(None)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            geoms = list(executor.map(lambda _: cache.get_or_compute(['916', 10000], compute), range(8)))
+
+    assert len(computed) == 1
+    assert fake.getinfo_calls == 1
+    assert all(geom is not None for geom in geoms)
+
+
+def test_failed_fetch_is_not_retried(tmp_path):
+    def fail(node):
+        raise fake.EEException('Computation timed out.')
+
+    with fake_earth_engine(responses={'simplify': fail}) as fake:
+        cache = AOICache(str(tmp_path))
+        first = cache.get_or_compute(['916', 10000], lambda: fake.Geometry(None))
+        second = cache.get_or_compute(['916', 10000], lambda: fake.Geometry(None))
+
+    assert first is second
+    assert fake.getinfo_calls == 1
@@ -0,0 +1,34 @@
+from ee import apifunction, customfunction
+from ee.computedobject import ComputedObject
+from instrument import graph_node_count
+
+# Signatures are given here so no Earth Engine session is needed
+ADD = apifunction.ApiFunction('Number.add', {'args': [{'name': 'left', 'type': 'Object'},
+                                                      {'name': 'right', 'type': 'Object'}], 'returns': 'Object'})
+MAP = apifunction.ApiFunction('List.map', {'args': [{'name': 'list', 'type': 'Object'},
+                                                    {'name': 'baseAlgorithm', 'type': 'Algorithm'}], 'returns': 'Object'})
+
+
+def add(left, right):
+    return ComputedObject(ADD, {'left': left, 'right': right})
+
+
+def test_counts_every_invocation_of_a_chain():
+    value = add(1, 2)
+    for i in range(20):
+        value = add(value, i)
+    assert graph_node_count(value) == 21
+
+
+def test_counts_shared_subgraphs_once():
+    shared = add(5, 6)
+    assert graph_node_count(add(shared, shared)) == 2
+    assert graph_node_count({'a': add(shared, 1), 'b': [shared]}) == 3
+
+
+def test_counts_mapped_function_bodies():
+    body = customfunction.CustomFunction({'args': [{'name': None, 'type': 'Object'}], 'returns': 'Object'},
+                                         lambda v: add(add(v, 1), 2))
+    mapped = ComputedObject(MAP, {'list': [1, 2, 3], 'baseAlgorithm': body})
+    # map, function definition, two adds and the argument reference
+    assert graph_node_count(mapped) == 5
@@ -0,0 +1,68 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+from conftest import FIXTURES
+from local_gradient import gradient_statistics, compare_with_ee
+sys.path.insert(0, FIXTURES)
+import make_gradient_fixture
+
+# PA of the fixture, see fixtures/make_gradient_fixture.py
+PA = box(*make_gradient_fixture.PA_BOUNDS)
+
+
+@pytest.fixture
+def expected():
+    return pd.read_csv(os.path.join(FIXTURES, 'gradient_expected.csv')).iloc[0]
+
+
+@pytest.fixture
+def raw_band(tmp_path):
+    """The fixture's band before the gradient, over the whole buffer AOI"""
+    path = tmp_path / 'band.tif'
+    make_gradient_fixture.write(path, make_gradient_fixture.plane()[0])
+    return path
+
+
+def test_parity_with_boundary_row(expected):
+    stats = gradient_statistics(os.path.join(FIXTURES, 'gradient_4326.tif'), PA)
+    assert set(stats) == {'boundary_x_mean', 'boundary_x_stdDev', 'boundary_x_count'}
+    compared = compare_with_ee({k: v for k, v in stats.items() if 'stdDev' not in k}, expected.to_dict())
+    assert compared['ok'].all(), compared
+    assert stats['boundary_x_stdDev'] < 1e-6
+
+
+def test_raw_band_matches_exported_gradient(expected, raw_band):
+    stats = gradient_statistics(raw_band, PA, is_gradient=False)
+    for zone in ['boundary', 'buffer']:
+        assert stats[f'{zone}_x_mean'] == pytest.approx(expected['boundary_x_mean'], rel=1e-3)
+        assert stats[f'{zone}_x_stdDev'] < 1e-2 * stats[f'{zone}_x_mean']
+    assert stats['boundary_x_count'] == pytest.approx(expected['boundary_x_count'], rel=0.05)
+
+
+def test_zones_are_metric_on_geographic_rasters(raw_band):
+    stats = gradient_statistics(raw_band, PA, is_gradient=False)
+    # A degree-unit buffer would cover the whole raster for both zones
+    assert stats['boundary_x_count'] < stats['buffer_x_count'] < 222 * 111
+
+
+def test_same_result_in_any_geometry_crs():
+    local = gradient_statistics(os.path.join(FIXTURES, 'gradient_4326.tif'), PA)
+    projected = gpd.GeoSeries([PA], crs='EPSG:4326').to_crs('EPSG:3035').iloc[0]
+    reprojected = gradient_statistics(os.path.join(FIXTURES, 'gradient_4326.tif'), projected, geometry_crs='EPSG:3035')
+    for key, value in local.items():
+        assert reprojected[key] == pytest.approx(value, rel=0.01)
+
+
+def test_rejects_non_metric_projected_raster(tmp_path):
+    path = tmp_path / 'feet.tif'
+    with rasterio.open(path, 'w', driver='GTiff', width=4, height=4, count=1, dtype='float32',
+                       crs='EPSG:2263', transform=from_origin(1000000, 200000, 1000, 1000)) as dst:
+        dst.write(np.arange(16, dtype='float32').reshape(1, 4, 4))
+    with pytest.raises(ValueError):
+        gradient_statistics(path, box(-74, 40.7, -73.99, 40.71))
@@ -0,0 +1,79 @@
+import pytest
+import analysis
+from fake_ee import fake_earth_engine, simulate_run
+from manifest import RunManifest
+from scheduler import EETaskBackend
+
+WDPAIDS = ['916', '917']
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analysis, 'AOI_CACHE_DIR', str(tmp_path / 'aoi_cache'))
+    return tmp_path
+
+
+def run(fake, workdir, **options):
+    options = analysis.RunOptions(pa_attributes=str(workdir / 'pa_attributes.json'), **options)
+    return analysis.run_all(WDPAIDS, 2010, 2, options, backend=EETaskBackend(), sleep=fake.clock.sleep,
+                            manifest_path=str(workdir / 'run_manifest.sqlite'), check_outputs=False)
+
+
+def test_run_all_completes_offline(workdir):
+    with fake_earth_engine(latency=(60, 300)) as fake:
+        results, records = run(fake, workdir)
+    assert results == {(w, y): 'COMPLETED' for w in WDPAIDS for y in (2010, 2011)}
+    assert len(records) == 4 and all(r['attempts'] == 1 and r['error'] is None for r in records)
+    assert all(r['reduction_level'] == 0 and r['submit_s'] >= 0 for r in records)
+    assert fake.task_starts == 4
+    # Status comes from bulk listings, never per-task status calls
+    assert fake.status_calls == 0
+    assert fake.list_calls > 0
+
+
+def test_run_all_resumes_from_manifest(workdir):
+    with fake_earth_engine(latency=(60, 300)) as fake:
+        run(fake, workdir)
+        starts = fake.task_starts
+        assert run(fake, workdir) == ({}, [])
+        assert fake.task_starts == starts
+
+
+def test_run_all_waits_on_tasks_left_running(workdir):
+    with fake_earth_engine(latency=100) as fake:
+        # A task an interrupted run left in flight, and one that failed
+        task_id = fake.tasks.start(object())
+        manifest = RunManifest(str(workdir / 'run_manifest.sqlite'))
+        manifest.record_submit('916', 2010, task_id, 'prefix')
+        manifest.record_submit('916', 2011, 'LOST', 'prefix')
+        manifest.update_state('916', 2011, 'FAILED')
+        manifest.close()
+
+        results, _ = run(fake, workdir)
+    assert results[('916', 2010)] == 'COMPLETED'
+    assert set(results.values()) == {'COMPLETED'}
+    # Everything but the adopted task was (re)submitted
+    assert fake.task_starts == 3
+
+
+def test_multi_year_run_offline(workdir):
+    with fake_earth_engine(latency=(60, 300)) as fake:
+        results, _ = run(fake, workdir, multi_year=True, pas_per_task=2)
+    assert set(results.values()) == {'COMPLETED'} and len(results) == 4
+    assert fake.task_starts == 1
+
+
+def test_simulate_run():
+    report = simulate_run(WDPAIDS, [2010, 2011, 2012], max_concurrent=2, latency=(60, 300))
+    assert report['tasks'] == 6 and report['failed'] == 0
+    assert report['task_starts'] == 6
+    assert report['simulated_seconds'] >= report['ideal_seconds']
+    assert report['list_calls'] == pytest.approx(report['simulated_seconds'] / 5)
+    assert report['getinfo_calls'] <= report['tasks']
+    assert report['mean_graph_nodes'] > 0
+
+
+def test_simulate_run_reports_failures():
+    report = simulate_run(WDPAIDS, [2010], max_concurrent=2, failure_rate=1.0)
+    assert report['failed'] == 2
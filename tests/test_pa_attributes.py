@@ -0,0 +1,57 @@
+import pytest
+from fake_ee import fake_earth_engine
+from core import GeometryOperations, StatsOperations
+from geometry_cache import AOICache
+from pa_attributes import PAAttributeCache
+
+
+def reduced(node):
+    return {'features': [{'properties': {'WDPA_PID': pid, 'gHM': 0.25, 'BIOME_NAME': 'Tundra'}}
+                         for pid in ('916', '917')]}
+
+
+def fill(path, water_mode, responses):
+    with fake_earth_engine(responses=responses):
+        cache = PAAttributeCache(str(path), GeometryOperations(water_mode=water_mode))
+        stored = cache.fill(['916', '917'], StatsOperations())
+    return cache, stored
+
+
+def test_entries_are_kept_per_water_mode(tmp_path):
+    path = tmp_path / 'pa_attributes.json'
+    vector, stored = fill(path, 'vector', {'map': reduced})
+    assert stored == 2
+    assert vector.get('916')['gHM'] == 0.25
+
+    with fake_earth_engine():
+        raster = PAAttributeCache(str(path), GeometryOperations(water_mode='raster'))
+        assert raster.get('916') is None
+        assert raster.missing(['916', '917']) == ['916', '917']
+        reopened = PAAttributeCache(str(path), GeometryOperations(water_mode='vector'))
+        assert reopened.missing(['916', '917']) == []
+
+
+def test_failed_chunk_is_skipped(tmp_path):
+    def timeout(node):
+        raise fake.EEException('Computation timed out.')
+
+    with fake_earth_engine(responses={'map': timeout}) as fake:
+        cache = PAAttributeCache(str(tmp_path / 'pa_attributes.json'), GeometryOperations())
+        assert cache.fill(['916', '917'], StatsOperations()) == 0
+    assert cache.missing(['916', '917']) == ['916', '917']
+
+
+@pytest.mark.parametrize('features, stored', [([], 0), (None, 2)])
+def test_returns_number_stored(tmp_path, features, stored):
+    response = {'features': features} if features is not None else reduced
+    assert fill(tmp_path / 'pa_attributes.json', 'vector', {'map': response})[1] == stored
+
+
+def test_fill_keeps_aois_server_side(tmp_path):
+    with fake_earth_engine(responses={'map': reduced}) as fake:
+        geo_ops = GeometryOperations(aoi_cache=AOICache(str(tmp_path / 'aoi_cache')))
+        cache = PAAttributeCache(str(tmp_path / 'pa_attributes.json'), geo_ops)
+        assert cache.fill(['916', '917'], StatsOperations()) == 2
+        # One getInfo for the chunk, none per PA for the AOI cache
+        assert fake.getinfo_calls == 1
+    assert geo_ops.aoi_cache is not None and '916' in cache
@@ -0,0 +1,84 @@
+import pytest
+from fake_ee import SimulatedClock
+from scheduler import ExportScheduler, FakeTaskBackend
+
+
+def make_scheduler(backend, clock, **options):
+    return ExportScheduler(backend, tick=5, sleep=clock.sleep, verbose=False, seed=0, **options)
+
+
+def test_keeps_max_concurrent_in_flight():
+    clock = SimulatedClock()
+    backend = FakeTaskBackend(duration=100, clock=clock)
+    scheduler = make_scheduler(backend, clock, max_concurrent=10)
+    results = scheduler.run(list(range(40)), lambda key: key)
+
+    assert results == {key: 'COMPLETED' for key in range(40)}
+    assert backend.start_calls == 40
+    # Four waves of 100 s, each finishing within a tick or two of its tasks
+    assert 400 <= clock.now <= 4 * (100 + 2 * 5)
+    # One listing call per tick, not one status call per task
+    assert backend.list_calls == clock.now / 5
+    assert [r['attempts'] for r in scheduler.results] == [1] * 40
+
+
+def test_backs_off_on_quota_without_losing_tasks():
+    clock = SimulatedClock()
+    backend = FakeTaskBackend(duration=100, clock=clock, quota=5)
+    scheduler = make_scheduler(backend, clock, max_concurrent=10, min_backoff=5, max_backoff=60)
+    results = scheduler.run(list(range(20)), lambda key: key)
+
+    assert set(results.values()) == {'COMPLETED'}
+    assert backend.start_calls > 20
+    assert all(r['attempts'] == 1 for r in scheduler.results)
+
+
+def test_build_errors_are_retried_then_reported():
+    clock = SimulatedClock()
+    backend = FakeTaskBackend(duration=10, clock=clock)
+    builds = []
+
+    def build(key):
+        builds.append(key)
+        if key == 3:
+            raise RuntimeError('graph too deep')
+        return key
+
+    scheduler = make_scheduler(backend, clock, max_concurrent=4, max_retries=2)
+    results = scheduler.run(list(range(6)), build)
+
+    assert results.pop(3) == 'SUBMIT_FAILED'
+    assert set(results.values()) == {'COMPLETED'}
+    assert builds.count(3) == 3
+    record = next(r for r in scheduler.results if r['key'] == 3)
+    assert record['attempts'] == 3 and 'graph too deep' in record['error']
+
+
+def test_failed_tasks_carry_backend_error():
+    clock = SimulatedClock()
+    backend = FakeTaskBackend(duration=10, clock=clock, failure_rate=lambda task: task == 'big',
+                              failure_message='User memory limit exceeded.')
+    scheduler = make_scheduler(backend, clock, max_concurrent=2)
+    results = scheduler.run(['small', 'big'], lambda key: key)
+
+    assert results == {'small': 'COMPLETED', 'big': 'FAILED'}
+    assert next(r for r in scheduler.results if r['key'] == 'big')['error'] == 'User memory limit exceeded.'
+
+
+def test_adopts_running_tasks():
+    clock = SimulatedClock()
+    backend = FakeTaskBackend(duration=50, clock=clock)
+    task_id = backend.start('earlier')
+    scheduler = make_scheduler(backend, clock, max_concurrent=2)
+    results = scheduler.run(['new'], lambda key: key, running={task_id: 'earlier'})
+
+    assert results == {'earlier': 'COMPLETED', 'new': 'COMPLETED'}
+    assert backend.start_calls == 2
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_worker_count_does_not_change_results(workers):
+    clock = SimulatedClock()
+    backend = FakeTaskBackend(duration=30, clock=clock)
+    scheduler = make_scheduler(backend, clock, max_concurrent=3, max_workers=workers)
+    assert set(scheduler.run(list(range(9)), lambda key: key).values()) == {'COMPLETED'}
@@ -0,0 +1,31 @@
+import numpy as np
+from fake_ee import fake_earth_engine
+from core import StatsOperations
+
+
+def merge(n, means, sds):
+    """StatsOperations.tiled_gradient_statistics' merge of per-tile (count, mean, stdDev), in NumPy"""
+    total = n.sum()
+    mean = (n * means).sum() / total
+    m2 = (n * sds ** 2 + n * (means - mean) ** 2).sum()
+    return mean, np.sqrt(m2 / total), total
+
+
+def test_merge_of_uneven_tiles_is_exact():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(size=5000)
+    tiles = np.split(values, [7, 900, 901, 3100])
+    n = np.array([t.size for t in tiles])
+    means = np.array([t.mean() for t in tiles])
+    sds = np.array([t.std() for t in tiles])
+
+    mean, sd, count = merge(n, means, sds)
+    assert count == values.size
+    assert np.isclose(mean, values.mean(), rtol=1e-12)
+    assert np.isclose(sd, values.std(), rtol=1e-12)
+
+
+def test_stats_reducer_is_unweighted():
+    # Weighted means merged with unweighted counts would not add up to the whole-region statistics
+    with fake_earth_engine():
+        assert StatsOperations().stats_reducer()._op == 'unweighted'
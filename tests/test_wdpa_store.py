@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import geopandas as gpd
+import pyarrow.parquet as pq
+from shapely.geometry import box
+from config import build_wdpa_store, read_wdpa_store
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(-170, 170, 2000), rng.uniform(-60, 60, 2000)
+    pas = gpd.GeoDataFrame({'WDPA_PID': [str(i) if i % 7 else f'{i}_A' for i in range(2000)]},
+                           geometry=[box(a, b, a + 0.1, b + 0.1) for a, b in zip(x, y)], crs='EPSG:4326')
+    folder = tmp_path_factory.mktemp('wdpa')
+    pas.to_file(folder / 'wdpa.gpkg')
+    return build_wdpa_store(folder / 'wdpa.gpkg', str(folder / 'wdpa.parquet'), row_group_size=250)
+
+
+def test_row_groups_are_spatially_compact(store):
+    meta = pq.ParquetFile(store).metadata
+    for i in range(meta.num_row_groups):
+        stats = {meta.row_group(i).column(j).path_in_schema: meta.row_group(i).column(j).statistics
+                 for j in range(meta.num_columns)}
+        area = ((stats['bbox.xmax'].max - stats['bbox.xmin'].min)
+                * (stats['bbox.ymax'].max - stats['bbox.ymin'].min))
+        assert area < 340 * 120 / 2
+
+
+def test_reads_by_pid_and_bbox(store):
+    rows = read_wdpa_store(['5', '14_A', 'missing'], store_path=store, columns=['WDPA_PID', 'geometry'])
+    assert sorted(rows['WDPA_PID']) == ['14_A', '5'] and list(rows.columns) == ['WDPA_PID', 'geometry']
+    inside = read_wdpa_store(bbox=(0, 0, 10, 10), store_path=store)
+    assert len(inside) and inside.intersects(box(0, 0, 10, 10)).all()